@@ -9,14 +9,16 @@ from pddl.srv import *
 from agent.srv import * 
 from environment.srv import *
 from util.goal_management import *
+from util.predicate_stream import PredicateStream
 
 actionInfoProxy = rospy.ServiceProxy('get_KB_action_info_srv', GetKBActionInfoSrv)
 envResetProxy = rospy.ServiceProxy('load_environment', HandleEnvironmentSrv)
 paramActionExecutionProxy = rospy.ServiceProxy('param_action_executor_srv', ParamActionExecutorSrv)
-scenarioData = rospy.ServiceProxy('scenario_data_srv', ScenarioDataSrv)
 addActionToKB = rospy.ServiceProxy('add_action_to_KB_srv', AddActionToKBSrv)
 novelEffectChecker = rospy.ServiceProxy('novel_effect_srv', NovelEffectsSrv)
 
+predicateStream = None
+
 #### Access functions
 def getObjectPose(object_name, pose_only=False):
     loc_pStamped = obj_location_srv(object_name)
@@ -52,15 +54,21 @@ def process_intervals(actionInfo, paramToVary, T):
     return paramVals
 
 def execute_and_evaluate_action(actionToVary, args, paramToVary, paramAssignment, env):
-    envResetProxy('restart', env)
+    if envResetProxy('restart', env).reset_skipped == True:
+        print('#### ---- (environment reset skipped, already in initial state)')
     print('#### ---- ' + str(actionToVary) + ', [' + str(paramToVary) + ']: ' + str(paramAssignment))
-    preconds = scenarioData().init
     exploration_start = rospy.get_time()
+    start_stamp = rospy.Time.now()
     paramActionExecutionProxy(actionToVary, args, [paramToVary], [str(paramAssignment)])
     exploration_end = rospy.get_time()
+    end_stamp = rospy.Time.now()
     
     exploration_time = exploration_end - exploration_start
-    effects = scenarioData().init
+    _, effects = predicateStream.settled(end_stamp)
+    _, preconds = predicateStream.at(start_stamp)
+    if preconds is None:
+        rospy.logerr("No predicate state recorded at the start of the action; not evaluated")
+        return False, False, [], exploration_time
     novelty = novelEffectChecker(actionToVary, args, preconds, effects) 
 
     is_novel = novelty.novel_action
@@ -121,6 +129,10 @@ def set_up_variations(req):
 
 def main():
     rospy.init_node("APV_node")
+
+    global predicateStream
+    predicateStream = PredicateStream()
+
     rospy.wait_for_service('/raw_action_executor_srv')
     rospy.Service("APV_srv", APVSrv, set_up_variations)
     # rospy.Service("generate_APV_combos", APVSrv, )
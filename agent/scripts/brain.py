@@ -18,6 +18,7 @@ APVproxy = rospy.ServiceProxy('APV_srv', APVSrv)
 planGenerator = rospy.ServiceProxy('plan_generator_srv', PlanGeneratorSrv)
 planExecutor = rospy.ServiceProxy('plan_executor_srv', PlanExecutorSrv)
 scenarioData = rospy.ServiceProxy('scenario_data_srv', ScenarioDataSrv)
+stateAtTime = rospy.ServiceProxy('state_at_time_srv', StateAtTimeSrv)
 KBDomainProxy = rospy.ServiceProxy('get_KB_domain_srv', GetKBDomainSrv)
 KBPddlLocsProxy = rospy.ServiceProxy('get_KB_pddl_locs', GetKBPddlLocsSrv)
 envProxy = rospy.ServiceProxy('load_environment', HandleEnvironmentSrv)
@@ -26,6 +27,13 @@ getScenarioSettings = rospy.ServiceProxy('scenario_settings_srv', GetScenarioSet
 getScenarioGoal = rospy.ServiceProxy('scenario_goal_srv', GetScenarioGoalSrv)
 resetKB = rospy.ServiceProxy("reset_KB_srv", ResetKBSrv)
 
+# State recorded at the given instant, or the current one if it is not in the history
+def stateAt(stamp):
+    snapshot = stateAtTime(stamp)
+    if snapshot.found == False:
+        return scenarioData(['init'])
+    return snapshot.state
+
 def handle_trial(req):
     resetKB()
     task = req.runName
@@ -42,7 +50,7 @@ def handle_trial(req):
     # Sim sensitive goals need to be re-calculated
     # if scenario in ['discover_strike']: goal = getScenarioSettings(scenario).goal  # Hack!
     
-    currentState = scenarioData() # A bit of a hack for now
+    currentState = scenarioData(['init']) # A bit of a hack for now
     
     print("################################################")
     print('#### ------------------------------------------ ')
@@ -89,8 +97,7 @@ def handle_trial(req):
             attempt_time += outcome.execution_time
 
             if (outcome.goal_complete == True): break 
-            currentState = scenarioData() # post trial scenario, set it now. This is what you want evaluated
-            momentOfFailurePreds = scenarioData().predicates
+            currentState = stateAt(outcome.end_stamp) # post trial scenario, at the moment the attempt ended. This is what you want evaluated
             #####################################################################################
 
             #####################################################################################
@@ -183,7 +190,7 @@ def handle_trial(req):
 def single_attempt_execution(task_name, goal, env, attempt='orig', action_exclusions=[], exploration_mode='focused', test_action=None):
     
     filename = task_name + '_' + str(attempt)
-    outcome = PlanExecutionOutcome(False, False, None, 0.0)  
+    outcome = PlanExecutionOutcome(False, False, None, 0.0, rospy.Time(), rospy.Time())  
     truncated_plan = []
     action_list = []
     action_exclusions = list(set(action_exclusions))
@@ -195,7 +202,9 @@ def single_attempt_execution(task_name, goal, env, attempt='orig', action_exclus
         print("#### -- ATTEMPT " + str(attempt)+ " [" + str(exploration_mode) + " mode]") 
 
     try:
-        envProxy('restart', env) if attempt != 'orig' else envProxy('no_action', env) 
+        envReset = envProxy('restart', env) if attempt != 'orig' else envProxy('no_action', env) 
+        if envReset.reset_skipped == True:
+            print("#### -- Environment reset skipped (already in initial state)")
         rospy.sleep(1)
     except rospy.ServiceException, e:
         print("Reset Environment Service call failed: %s"%e)
@@ -214,7 +223,7 @@ def single_attempt_execution(task_name, goal, env, attempt='orig', action_exclus
         moveToStartProxy()
 
     try:
-        initStateInfo = scenarioData()
+        initStateInfo = scenarioData(['init', 'predicateList'])
         initObjsIncludingLoc = extendInitLocs(initStateInfo, [])
         initObjsIncludingLoc['gripper'] = ['left_gripper']
         initObjsIncludingLoc['obj'] = ['cup', 'cover']
@@ -237,7 +246,7 @@ def single_attempt_execution(task_name, goal, env, attempt='orig', action_exclus
         print("#### ---- ")
 
         outcome = planExecutor(plan.plan).execution_outcome
-        endStateInfo = scenarioData().init
+        endStateInfo = stateAt(outcome.end_stamp).init
         outcome.goal_complete = goalAccomplished(goal, endStateInfo)
 
         if (outcome.failure_action != ''):
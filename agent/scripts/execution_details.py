@@ -23,6 +23,7 @@ from environment.srv import ObjectLocationSrv
 from util.action_request import ActionRequest
 from util.data_conversion import arg_list_to_hash
 from util.data_conversion import * 
+from util.scenario_registry import scenario_registry, scenario_spec
 
 getObjLoc = rospy.ServiceProxy('object_location_srv', ObjectLocationSrv)
 
@@ -144,50 +145,29 @@ def get_moveMag(req):
     vals = moveMagHelper[orientation]
     return HardcodedOffset(vals['x'], vals['y'], vals['z'])
 
+# Goals may refer to object locations, e.g. {cover}, filled in at request time
 def scenario_goal(req):
-    scenario = req.scenario
-    if scenario == 'discover_strike':
-        coverLoc = getObjLoc('cover').location
-        goal = ['(not (at cover '+ poseStampedToString(coverLoc) + '))']
-    elif scenario == 'discover_pour':
-        goal = ['(not (touching cover cup))']
-    elif scenario in ['cook', 'cook_defocused']:
-        goal = ['(cooking cup)']
-    else:
-        goal = []
+    spec = scenario_spec(req.scenario)
+    if spec is None:
+        return GetScenarioGoalSrvResponse([])
+    locs = dict((obj, poseStampedToString(getObjLoc(obj).location)) for obj in spec.get('goal_locations', []))
+    goal = [g.format(**locs) for g in spec['goal']]
     return GetScenarioGoalSrvResponse(goal)
 
 
 def scenario_settings(req):
-    scenario = req.scenario
-    if scenario == 'discover_strike':
-        orig_scenario = 'discover_strike'
-        novel_scenario = 'HH'
-        T = 7
-    elif scenario == 'discover_pour':
-        orig_scenario = 'discover_pour'
-        novel_scenario = 'high_friction'
-        T = 3
-    elif scenario == 'cook':
-        orig_scenario = 'cook'
-        novel_scenario = 'cook_low_friction'
-        T = 3
-    elif scenario == 'cook_defocused':
-        orig_scenario = 'cook'
-        novel_scenario = 'cook_defocused'
-        T = 3
-    else:
-        orig_scenario = ''
-        novel_scenario = ''
-        T = 0
-    return GetScenarioSettingsSrvResponse(orig_scenario, 
-                                          novel_scenario, 
-                                          T)
+    spec = scenario_spec(req.scenario)
+    if spec is None:
+        return GetScenarioSettingsSrvResponse('', '', 0)
+    return GetScenarioSettingsSrvResponse(spec['orig_scenario'], 
+                                          spec['novel_scenario'], 
+                                          spec['T'])
 
 ################################################################################
 
 def main():
     rospy.init_node("execution_info_node")
+    scenario_registry()
     rospy.Service("get_offset_srv", GetHardcodedOffsetSrv, get_offset)
     rospy.Service("get_movemag_unit_srv", GetMoveMagUnitSrv, get_moveMag)
     rospy.Service("calc_gripper_orientation_pose", CalcGripperOrientationPoseSrv, orientation_solver)
@@ -28,7 +28,8 @@ from std_msgs.msg import (
 from agent.srv import *
 from pddl.srv import *
 from pddl.msg import *
-from environment.srv import ObjectLocationSrv
+from environment.srv import ObjectLocationSrv, LatencyStatsSrv, LatencyStatsSrvResponse
+from environment.msg import LatencyHistogram
 from util.physical_agent import PhysicalAgent
 from util.action_request import ActionRequest
 from util.data_conversion import arg_list_to_hash
@@ -97,7 +98,7 @@ def push(req):
     argVals = [gripper, startPose, endPose, rate]
     args = arg_list_to_hash(argNames, argVals)
 
-    pa.push(**args)
+    return pa.push(**args)
 
 #### SHAKE #####################################################################
 def shake(req):
@@ -113,7 +114,7 @@ def shake(req):
     argVals = [gripper, startPose, orientation, twist_range, rate]
     args = arg_list_to_hash(argNames, argVals)
 
-    pa.shake(**args)
+    return pa.shake(**args)
 
 #### COVER OBJ #####################################################################
 def cover_obj(req):
@@ -126,7 +127,7 @@ def cover_obj(req):
     argVals = [gripper, objPose1, objPose2]
     args = arg_list_to_hash(argNames, argVals)
 
-    pa.cover_obj(**args)
+    return pa.cover_obj(**args)
 
 #### STUB #####################################################################
 def stub_action(req):
@@ -151,8 +152,9 @@ def action_executor(req):
                                    req.paramNames, 
                                    req.params)
     try:
-        a(zipped_request)
-        return True
+        # primitives return False when they do not execute, e.g. on an 
+        # unreachable waypoint 
+        return a(zipped_request) is not False
     except:
         return False
 
@@ -227,6 +229,11 @@ def close_gripper(req):
 def approach(req):
     return ApproachSrvResponse(pa.approach(req.pose))
 
+# IK latency by cache outcome, for run_experiment's per-run ik_stats
+def getIKStats(req):
+    return LatencyStatsSrvResponse([LatencyHistogram(hop, h.edges, h.counts, h.count, h.mean(), h.max)
+                                    for hop, h in pa.ik_stats_snapshot(req.reset)])
+
 ################################################################################
 
 def main():
@@ -239,6 +246,7 @@ def main():
     rospy.Service("pddl_action_executor_srv", PddlExecutorSrv, pddl_action_executor)
     rospy.Service("raw_action_executor_srv", RawActionExecutorSrv, raw_action_executor)
     rospy.Service("param_action_executor_srv", ParamActionExecutorSrv, param_action_executor)
+    rospy.Service("ik_stats_srv", LatencyStatsSrv, getIKStats)
 
     rospy.spin()
 
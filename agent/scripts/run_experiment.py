@@ -2,12 +2,18 @@
 
 import rospy
 from agent.srv import *
+from environment.srv import LatencyStatsSrv
 from util.goal_management import *
 
 BrainProxy = rospy.ServiceProxy('brain_srv', BrainSrv)
+latencyStats = rospy.ServiceProxy('latency_stats_srv', LatencyStatsSrv)
+ikStats = rospy.ServiceProxy('ik_stats_srv', LatencyStatsSrv)
+resetStats = rospy.ServiceProxy('reset_stats_srv', LatencyStatsSrv)
 experiments_csv_header = ['scenario', 'run_name', 'total_time', 'num_trails', 'avg_trial_time', 'success_actions']
 
 individual_run_csv_header = ['exploration_times', 'total_time', 'success_plan']
+latency_csv_header = ['hop', 'count', 'mean', 'max', 'bin_edges', 'counts']
+ik_csv_header = ['hop', 'count', 'share', 'mean', 'max', 'bin_edges', 'counts']
 demo_mode = False
 
 
@@ -51,6 +57,36 @@ def format_run_result(result):
     formatted_plan = str(formatted_plan).replace(' ', '')
     for_csv.append(formatted_plan)
     return for_csv
+
+# Per-hop state latency histograms collected by scenario_data during the run, 
+# or (reset_stats) the durations of the environment restarts that ran and of 
+# the ones skipped, collected by load_environment 
+def write_latency_stats(run_results_dir, stats=latencyStats, name='latency_stats'):
+    try:
+        hops = stats(True).hops
+    except rospy.ServiceException, e:
+        print("Latency stats call failed: %s"%e)
+        return
+    latency_file = initResultCsvFile(run_results_dir, name, latency_csv_header)
+    for h in hops:
+        writeResult(latency_file, [h.hop, h.count, h.mean, h.max, 
+                                   str(list(h.bin_edges)).replace(' ', ''), 
+                                   str(list(h.counts)).replace(' ', '')])
+
+# IK latency by cache outcome (ik_hit, ik_seeded, ik_unseeded) collected by the
+# physical agent during the run; the ik_hit share is the cache hit rate
+def write_ik_stats(run_results_dir):
+    try:
+        hops = ikStats(True).hops
+    except rospy.ServiceException, e:
+        print("IK stats call failed: %s"%e)
+        return
+    requests = sum(h.count for h in hops)
+    ik_file = initResultCsvFile(run_results_dir, 'ik_stats', ik_csv_header)
+    for h in hops:
+        writeResult(ik_file, [h.hop, h.count, float(h.count) / requests if requests > 0 else 0.0, h.mean, h.max, 
+                              str(list(h.bin_edges)).replace(' ', ''), 
+                              str(list(h.counts)).replace(' ', '')])
 #######################################################################
 
 
@@ -111,8 +147,20 @@ def run_experiment(experimentName, experiment_path, scenarioName, num_runs):
         result_file = initResultCsvFile(run_results_dir, 'run_results', individual_run_csv_header)
 
         # Run it!
+        try:
+            latencyStats(True) # start the run with empty histograms
+        except rospy.ServiceException, e:
+            print("Latency stats call failed: %s"%e)
+        try:
+            ikStats(True)
+            resetStats(True)
+        except rospy.ServiceException, e:
+            print("IK/reset stats call failed: %s"%e)
         result = BrainProxy(run_name, scenarioName, demo_mode)
         rospy.sleep(1)
+        write_latency_stats(run_results_dir)
+        write_ik_stats(run_results_dir)
+        write_latency_stats(run_results_dir, resetStats, 'reset_stats')
 
         # Close out
         formatted_result = format_run_result(result)
@@ -1,31 +1,117 @@
 #!/usr/bin/env python
 
 import rospy
+import threading
+import tf
+from tf.transformations import translation_matrix, quaternion_matrix, concatenate_matrices
 
-from environment.srv import * 
+from std_msgs.msg import Header
+from sensor_msgs.msg import CameraInfo
+
+from environment.srv import *
 from agent.srv import *
+from agent.msg import VisibleObjects, ColorDetections
+
+from util.image_converter import *
+from util.scenario_registry import scenario_registry
+
+# The one place camera frames are processed. Visibility is served on demand
+# through is_visible_srv and pushed (latched, on change) on visible_objects,
+# which is what scenario_data follows. The blobs of the object colors go out
+# on color_detections for every processed frame, projected onto the table top
+# when the camera model is known.
+VISION_RATE = 5 # hz, cap on background frame processing
 
-from util.image_converter import ImageConverter
+# Frames are cropped before classification: 'table' to the table top as seen 
+# by the camera, 'full' not at all, or an explicit [x, y, w, h]. Then they are 
+# halved DOWNSCALE times. Subsampling can drop thin or partly occluded objects 
+# (is_visible is pixels > 0), so it is off until checked on recorded frames. 
+ROI_MODE = 'table'
+DOWNSCALE = 0
+CAMERA_INFO_TOPIC = 'cameras/head_camera/camera_info'
+ROBOT_FRAME = 'base'
+BASE_HEIGHT = 0.93 # gazebo world z of the robot's base frame
+DETECT = True
+PROJECT = True
 
 IC = None
+visiblePublisher = rospy.Publisher('visible_objects', VisibleObjects, queue_size = 1, latch = True)
+detectionsPublisher = rospy.Publisher('color_detections', ColorDetections, queue_size = 1)
+table_homography = None
+published_visible = None
+publish_lock = threading.Lock()
 
 def is_visible_callback(req):
     return IC.is_visible(req.object)
 
+# (world_to_camera, CameraInfo) of the head camera, or None if the camera 
+# model or transform are not available 
+def cameraModel(timeout=10.0):
+    try:
+        info = rospy.wait_for_message(CAMERA_INFO_TOPIC, CameraInfo, timeout)
+        listener = tf.TransformListener()
+        listener.waitForTransform(info.header.frame_id, ROBOT_FRAME, rospy.Time(0), rospy.Duration(timeout))
+        trans, rot = listener.lookupTransform(info.header.frame_id, ROBOT_FRAME, rospy.Time(0))
+    except (rospy.ROSException, tf.Exception), e:
+        rospy.logwarn("No head camera model: {0}".format(e))
+        return None
+    world_to_camera = concatenate_matrices(translation_matrix(trans), quaternion_matrix(rot),
+                                           translation_matrix((0, 0, -BASE_HEIGHT)))
+    return world_to_camera, info
+
+# The camera's view of the table top for 'table' (None, i.e. full frames, 
+# without a camera model) 
+def regionOfInterest(mode, camera):
+    if mode == 'table':
+        return None if camera is None else table_roi(scenario_registry()['table'], camera[0], camera[1])
+    elif mode == 'full':
+        return None
+    return tuple(int(p) for p in mode)
+
+def publish_detections(blobs):
+    colors = [b.color for b in blobs]
+    owners = dict((color, obj) for obj, color in OBJECT_COLORS.items())
+    centroids = [c for b in blobs for c in b.centroid]
+    table_points = []
+    if (table_homography is not None) and (len(blobs) > 0):
+        table_points = pixels_to_table(table_homography, [b.centroid for b in blobs]).ravel().tolist()
+    detectionsPublisher.publish(ColorDetections(Header(stamp=rospy.Time.now()), colors,
+                                [owners.get(c, '') for c in colors], [b.area for b in blobs], centroids,
+                                [v for b in blobs for v in b.bbox], table_points))
+
+def publish_visible(visible):
+    global published_visible
+    with publish_lock:
+        if visible == published_visible:
+            return
+        published_visible = visible
+        visiblePublisher.publish(VisibleObjects(Header(stamp=rospy.Time.now()), visible))
+
 ################################################################################
 
 def main():
     rospy.init_node("vision_node")
-    # rospy.wait_for_message("/models_loaded", Bool) 
-    
+    # rospy.wait_for_message("/models_loaded", Bool)
+
     global IC
-    IC = ImageConverter()
-    
+    global table_homography
+    roi_mode = rospy.get_param('~roi', ROI_MODE)
+    project = rospy.get_param('~project', PROJECT)
+    camera = cameraModel() if (roi_mode == 'table') or project else None
+    if project and (camera is not None):
+        table_homography = table_plane_homography(scenario_registry()['table'], camera[0], camera[1])
+    roi = regionOfInterest(roi_mode, camera)
+    downscale = rospy.get_param('~downscale', DOWNSCALE)
+    rospy.loginfo("Vision ROI: {0}, downscale: {1}".format(roi, downscale))
+    IC = ImageConverter(rate=rospy.get_param('~rate', VISION_RATE), on_update=publish_visible,
+                        roi=roi, downscale=downscale,
+                        detect=rospy.get_param('~detect', DETECT), on_detections=publish_detections)
+
     rospy.Service("is_visible_srv", IsVisibleSrv, is_visible_callback)
 
     rospy.spin()
 
-    return 0 
+    return 0
 ################################################################################
 
 if __name__ == "__main__":
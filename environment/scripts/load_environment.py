@@ -6,17 +6,24 @@ import argparse
 import struct
 import sys
 import copy
+import math
+import time
 import rospy
 import rospkg
+from collections import OrderedDict
 
 from gazebo_msgs.srv import (
     SpawnModel,
     DeleteModel,
     GetModelState,
     GetLinkState,
+    SetModelState,
+    GetWorldProperties,
 )
 from gazebo_msgs.msg import (
     LinkState,
+    ModelState,
+    ModelStates,
 )
 from geometry_msgs.msg import (
     PoseStamped,
@@ -28,190 +35,243 @@ from std_msgs.msg import (
     Header,
     Empty,
     Bool,
+    String,
 )
 
 import tf
 from tf.transformations import *
 
 from environment.srv import * 
+from environment.msg import LatencyHistogram
 from agent.srv import MoveToStartSrv
+from util.scenario_objects import ACTIVE_SCENARIO_TOPIC
+from util.scenario_registry import scenario_registry, environment_spec
+from util.latency_stats import LatencyStats
 
 environment = 'default'
 
 pub_all = rospy.Publisher('models_loaded', Bool, queue_size=10)
 require_burner_on = rospy.Publisher('require_burner_on', Bool, queue_size = 10)
+# Latched, so publish_environment/scenario_data pick up the scenario whenever they start
+active_scenario = rospy.Publisher(ACTIVE_SCENARIO_TOPIC, String, queue_size = 1, latch = True)
 
 moveToStartProxy = rospy.ServiceProxy('move_to_start_srv', MoveToStartSrv)
 resetPreds = rospy.ServiceProxy('reset_env_preds', EmptySrvReq)
+spawn_sdf = rospy.ServiceProxy('/gazebo/spawn_sdf_model', SpawnModel)
+delete_model = rospy.ServiceProxy('/gazebo/delete_model', DeleteModel)
+setModelState = rospy.ServiceProxy('/gazebo/set_model_state', SetModelState)
+getWorldProperties = rospy.ServiceProxy('/gazebo/get_world_properties', GetWorldProperties)
+
+# Environments are switched differentially: only models that are missing, or 
+# present as a different variant, are deleted/spawned; the rest just get their 
+# pose reset. The table is spawned once and never touched again. 
+# spawned_models: name -> registry model name (None if found in gazebo at startup)
+spawned_models = OrderedDict()
+table_spawned = False
+DELETE_SETTLE = 1   # s after each delete
+SPAWN_SETTLE = 4    # s after a switch that spawned or deleted models
+RESET_SETTLE = 2    # s after a switch that only reset poses
+
+# A restart into the environment that is already loaded is skipped when every 
+# model is still at rest within tolerance of the settled state captured after 
+# that environment's last full reset. The arm is still sent home and the 
+# predicate latches are still cleared. 
+POSITION_TOLERANCE = 0.01    # m
+ORIENTATION_TOLERANCE = 0.05 # rad
+VELOCITY_TOLERANCE = 0.01    # m/s
+MODEL_STATES_TIMEOUT = 5.0   # s
+current_environment = None
+canonical_states = {}        # env -> {name : Pose}
+
+# Restart durations (wall time, arm move excluded) served on reset_stats_srv: 
+# 'reset' for the restarts that ran, 'reset_skipped' for the time each skipped 
+# one would have taken, i.e. the last measured pose-only reset of that 
+# environment, or its spec's settle times before any was measured. 
+# Binned over 0.1-30s rather than the state pipeline's latency bins. 
+RESET_HOPS = ['reset', 'reset_skipped']
+RESET_BIN_EDGES = [0.1, 0.2, 0.5, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0, 15.0, 20.0, 30.0]
+resetStats = LatencyStats(RESET_HOPS, RESET_BIN_EDGES)
+reset_costs = {}             # env -> s of its last pose-only reset
+
+# Model XML keyed by registry model name. Read from disk once, at startup 
+model_xml = {}
+
+def cache_model_xml():
+    model_path = rospkg.RosPack().get_path('environment')+"/models/"
+    for model, sdf in scenario_registry()['models'].items():
+        with open (model_path + sdf, "r") as model_file:
+            model_xml[model]=model_file.read().replace('\n', '')
+
+def poseFromList(position):
+    return Pose(position=Point(x=position[0], y=position[1], z=position[2]))
+
+# Picks up models left in gazebo by a previous run of this node, so that the 
+# first switch treats them as stale rather than spawning over them 
+def find_existing_models():
+    global table_spawned
+    table = scenario_registry()['table']['name']
+    try:
+        for name in getWorldProperties().model_names:
+            if name == table:
+                table_spawned = True
+            elif name in scenario_models():
+                spawned_models[name] = None
+    except rospy.ServiceException, e:
+        rospy.logerr("get_world_properties service call failed: {0}".format(e))
 
-#SPAWN WALL AT 1.1525 z to be above table or 0.3755 to be below
-def load_gazebo_models(env='default'):
+# Every model name any environment spawns
+def scenario_models():
+    return set(m['name'] for env in scenario_registry()['environments'].values() for m in env['spawn'])
 
-    table_pose=Pose(position=Point(x=0.78, y=0.0, z=0.0))
-    right_button_pose=Pose(position=Point(x=0.6, y=-0.2715, z=0.775))
-    left_button_pose=Pose(position=Point(x=0.6, y=0.1515, z=0.775))
-    breakable_obj_pose=Pose(position=Point(x=0.5, y=0.0, z=0.9))
-    cup_pose=Pose(position=Point(x=0.5, y=0.0, z=0.9))
-    cover_pose=Pose(position=Point(x=0.5, y=0.0, z=0.9))
-    burner_pose=Pose(position=Point(x=0.5, y=-0.11, z=0.775))
+# One sample of gazebo/model_states, taken only when a restart needs it rather 
+# than subscribing at physics rate. None if none arrives in time. 
+def sample_model_states():
+    try:
+        return rospy.wait_for_message('/gazebo/model_states', ModelStates, timeout=MODEL_STATES_TIMEOUT)
+    except rospy.ROSException, e:
+        rospy.logerr("No gazebo/model_states sample: {0}".format(e))
+        return None
+
+def capture_canonical_state(env):
+    states = sample_model_states()
+    if states is None:
+        return
+    poses = dict(zip(states.name, states.pose))
+    canonical_states[env] = dict((name, poses[name]) for name in spawned_models if name in poses)
+
+def pose_within_tolerance(pose, reference):
+    p, r = pose.position, reference.position
+    if math.sqrt((p.x-r.x)**2 + (p.y-r.y)**2 + (p.z-r.z)**2) > POSITION_TOLERANCE:
+        return False
+    q, s = pose.orientation, reference.orientation
+    dot = min(abs(q.x*s.x + q.y*s.y + q.z*s.z + q.w*s.w), 1.0)
+    return 2*math.acos(dot) <= ORIENTATION_TOLERANCE
+
+def matches_canonical_state(env):
+    canonical = canonical_states.get(env)
+    if (env != current_environment) or (canonical is None):
+        return False
+    if set(canonical.keys()) != set(spawned_models.keys()):
+        return False
+    states = sample_model_states()
+    if states is None:
+        return False
+    current = dict((name, (pose, twist)) for name, pose, twist in zip(states.name, states.pose, states.twist))
+    for name, reference in canonical.items():
+        if name not in current:
+            return False
+        pose, twist = current[name]
+        v = twist.linear
+        if math.sqrt(v.x**2 + v.y**2 + v.z**2) > VELOCITY_TOLERANCE:
+            return False
+        if not pose_within_tolerance(pose, reference):
+            return False
+    return True
+
+# Expected duration of a pose-only reset of env
+def reset_cost(env):
+    if env in reset_costs:
+        return reset_costs[env]
+    return RESET_SETTLE + sum(m.get('settle', 0) for m in environment_spec(env)['spawn'])
+
+# Returns True if the restart could be skipped
+def skip_reset(env):
+    if not matches_canonical_state(env):
+        return False
+    resetPreds()
+    resetStats.record('reset_skipped', reset_cost(env))
+    skipped = resetStats.get('reset_skipped')
+    rospy.loginfo("Skipped reset of '{0}': world already in its initial state ({1}/{2} restarts skipped, ~{3:.1f}s saved)".format(
+                  env, skipped.count, skipped.count + resetStats.get('reset').count, skipped.total))
+    return True
+
+def getResetStats(req):
+    return LatencyStatsSrvResponse([LatencyHistogram(hop, h.edges, h.counts, h.count, h.mean(), h.max)
+                                    for hop, h in resetStats.snapshot(req.reset)])
+
+# A model gazebo failed to delete stays tracked, so it is not spawned over. 
+# Likewise, one it failed to spawn is never tracked (nor reset). 
+def delete_models(names):
+    for name in names:
+        resp = delete_model(name)
+        if not resp.success:
+            rospy.logerr("Delete of model '{0}' failed: {1}".format(name, resp.status_message))
+            continue
+        del spawned_models[name]
+        rospy.sleep(DELETE_SETTLE)
 
+#SPAWN WALL AT 1.1525 z to be above table or 0.3755 to be below
+# Returns whether any model was spawned or deleted
+def load_gazebo_models(env='default', move_home=True):
+    global table_spawned
+    global current_environment
+    spec = environment_spec(env)
     reference_frame="world"
 
-
-    # Get Models' Path
-    model_path = rospkg.RosPack().get_path('environment')+"/models/"
-
-    table_xml = ''
-    breakable_obj_xml = ''
-    cup_xml = ''
-    cover_xml = ''
-    burner_xml = ''
-    button_xml = ''
-
-    moveToStartProxy('both')
+    if move_home:
+        moveToStartProxy('both')
     require_burner_on.publish(False)
-    
-    with open (model_path + "cafe_table/model.sdf", "r") as table_file:
-        table_xml=table_file.read().replace('\n', '')
-
-    ###############################
-    #### DISCOVER STRIKE ##########
-    if env == 'discover_strike':
-        with open (model_path + "cup_with_cover/cup_model.sdf", "r") as cup_file:
-            cup_xml=cup_file.read().replace('\n', '')
-        with open (model_path + "cup_with_cover/cover_model.sdf", "r") as cover_file:
-            cover_xml=cover_file.read().replace('\n', '')
-
-    ###############################
-    ######## HEAVY HIGH FRICTION ##
-    elif env == 'HH':
-        with open (model_path + "cup_with_cover/cup_model.sdf", "r") as cup_file:
-            cup_xml=cup_file.read().replace('\n', '')
-        with open (model_path + "cup_with_cover/cover_model_heavy_high_friction.sdf", "r") as cover_file:
-            cover_xml=cover_file.read().replace('\n', '')
-
-
-    ###############################
-    ########     COOK      ########
-    elif env in ['cook', 'cook_defocused']:
-        with open (model_path + "cup_with_cover/cup_model.sdf", "r") as cup_file:
-            cup_xml=cup_file.read().replace('\n', '')
-        with open (model_path + "cup_with_cover/cover_model_high_friction.sdf", "r") as cover_file:
-            cover_xml=cover_file.read().replace('\n', '')
-        with open (model_path + "cook/burner_model.sdf", "r") as burner_file:
-            burner_xml=burner_file.read().replace('\n', '')
-        with open (model_path + "cook/button_model.sdf", "r") as button_file:
-            button_xml=button_file.read().replace('\n', '')
-
-    ###############################
-    #### COOK LOW FRICTION ########
-    #### JUST CUP          ########
-    elif env in ['cook_low_friction', 'just_cup']:
-        with open (model_path + "cup_with_cover/cup_model.sdf", "r") as cup_file:
-            cup_xml=cup_file.read().replace('\n', '')
-        with open (model_path + "cup_with_cover/cover_model_low_friction.sdf", "r") as cover_file:
-            cover_xml=cover_file.read().replace('\n', '')
-        with open (model_path + "cook/burner_model.sdf", "r") as burner_file:
-            burner_xml=burner_file.read().replace('\n', '')
-
-    ###############################
-    #### BREAKABLE OBJ ############
-    elif env == 'breakable':
-        with open (model_path + "breakable_obj/test_model.sdf", "r") as breakable_obj_file:
-            breakable_obj_xml=breakable_obj_file.read().replace('\n', '')
-            
-    ###############################
-    ########### DEFAULT ########### 
-    else:
-        with open (model_path + "cup_with_cover/cup_model.sdf", "r") as cup_file:
-            cup_xml=cup_file.read().replace('\n', '')
-        with open (model_path + "cup_with_cover/cover_model_high_friction.sdf", "r") as cover_file:
-            cover_xml=cover_file.read().replace('\n', '')
-
-
 
-    # Spawn Table SDF and other URDFs
     rospy.wait_for_service('/gazebo/spawn_sdf_model')
-    spawn_sdf = rospy.ServiceProxy('/gazebo/spawn_sdf_model', SpawnModel)
+
+    target = dict((m['name'], m['model']) for m in spec['spawn'])
+    # Reverse spawn order, so stacked models (cover on cup) go first
+    stale = [name for name in reversed(spawned_models.keys()) if target.get(name) != spawned_models[name]]
+    changed = len(stale) > 0
 
 
     #  *********************************************************************  #
     #  ******************************* SPAWN *******************************  # 
     #  *********************************************************************  #
-    try:
-        spawn_sdf("cafe_table", table_xml, "/", table_pose, reference_frame)
-    except rospy.ServiceException, e:
-        rospy.logerr("Spawn URDF service call failed: {0}".format(e))
-
-    if env in ['cook', 'cook_low_friction']:
-        try: 
-            spawn_sdf("burner1", burner_xml, "/", burner_pose, reference_frame)
-            spawn_sdf("cup", cup_xml, "/", cup_pose, reference_frame)
-            rospy.sleep(0.5)
-            spawn_sdf("cover", cover_xml, "/", cover_pose, reference_frame)
-        except rospy.ServiceException, e:
-            rospy.logerr("Spawn URDF service call failed: {0}".format(e))
-    
-    elif env in ['cook_defocused']:
-        try: 
-            spawn_sdf("burner1", burner_xml, "/", burner_pose, reference_frame)
-            spawn_sdf("cup", cup_xml, "/", cup_pose, reference_frame)
-            rospy.sleep(0.5)
-            spawn_sdf("cover", cover_xml, "/", cover_pose, reference_frame)
-            spawn_sdf("right_button", button_xml, "/", right_button_pose, reference_frame)
-            spawn_sdf("left_button", button_xml, "/", left_button_pose, reference_frame)
-            require_burner_on.publish(True)
-        except rospy.ServiceException, e:
-            rospy.logerr("Spawn URDF service call failed: {0}".format(e))
-    
-
-    elif env in ['discover_strike', 'discover_pour', 'HH']:
+    if table_spawned == False:
+        table = scenario_registry()['table']
         try:
-            spawn_sdf("cup", cup_xml, "/", cup_pose, reference_frame)
-            rospy.sleep(0.5)
-            spawn_sdf("cover", cover_xml, "/", cover_pose, reference_frame)
-
+            resp = spawn_sdf(table['name'], model_xml[table['model']], "/", poseFromList(table['pose']), reference_frame)
+            if resp.success:
+                table_spawned = True
+            else:
+                rospy.logerr("Spawn of model '{0}' failed: {1}".format(table['name'], resp.status_message))
         except rospy.ServiceException, e:
             rospy.logerr("Spawn URDF service call failed: {0}".format(e))
 
-    elif env in ['just_cup']:
-        try: 
-            spawn_sdf("burner1", burner_xml, "/", burner_pose, reference_frame)
-            spawn_sdf("cup", cup_xml, "/", cup_pose, reference_frame)
-        except rospy.ServiceException, e:
-            rospy.logerr("Spawn URDF service call failed: {0}".format(e))
-      
-    # elif env in ['breakable']:
-    #     try:
-    #         spawn_sdf("breakable_obj", breakable_obj_xml, "/", breakable_obj_pose, reference_frame)
-    #     except rospy.ServiceException, e:
-    #         rospy.logerr("Spawn URDF service call failed: {0}".format(e))
+    try:
+        delete_models(stale)
+        for model in spec['spawn']:
+            if model['name'] in spawned_models:
+                setModelState(ModelState(model_name=model['name'], pose=poseFromList(model['pose']), reference_frame=reference_frame))
+            else:
+                resp = spawn_sdf(model['name'], model_xml[model['model']], "/", poseFromList(model['pose']), reference_frame)
+                if not resp.success:
+                    rospy.logerr("Spawn of model '{0}' failed: {1}".format(model['name'], resp.status_message))
+                    continue
+                spawned_models[model['name']] = model['model']
+                changed = True
+            if 'settle' in model:
+                rospy.sleep(model['settle'])
+        if spec.get('require_burner_on', False):
+            require_burner_on.publish(True)
+    except rospy.ServiceException, e:
+        rospy.logerr("Spawn URDF service call failed: {0}".format(e))
 
+    current_environment = env
+    active_scenario.publish(env)
     resetPreds()
     pub_all.publish(True)
+    return changed
 
 
 def delete_gazebo_models():
+    global current_environment
     # This will be called on ROS Exit, deleting Gazebo models
     # Do not wait for the Gazebo Delete Model service, since
     # Gazebo should already be running. If the service is not
     # available since Gazebo has been killed, it is fine to error out
     try:
+        current_environment = None
         pub_all.publish(False)
+        active_scenario.publish('')
         
-        delete_model = rospy.ServiceProxy('/gazebo/delete_model', DeleteModel)
-        delete_model("cover")
-        rospy.sleep(1)
-        delete_model("cup")
-        rospy.sleep(1)
-        delete_model("burner1")
-        rospy.sleep(1)
-        delete_model("left_button")
-        rospy.sleep(1)
-        delete_model("right_button")
-        rospy.sleep(1)
-        # delete_model("breakable_obj")
-        # rospy.sleep(1)
+        delete_models(list(reversed(spawned_models.keys())))
         resetPreds()
         # delete_model("cafe_table")
 
@@ -227,36 +287,43 @@ def handle_environment_request(req):
             rospy.sleep(1)
             load_gazebo_models(environment)
             rospy.sleep(2)
-            return HandleEnvironmentSrvResponse(1)
+            capture_canonical_state(environment)
+            return HandleEnvironmentSrvResponse(1, False)
         except rospy.ServiceException, e:
             rospy.logerr("Init environment call failed: {0}".format(e))
-            return HandleEnvironmentSrvResponse(0)
+            return HandleEnvironmentSrvResponse(0, False)
 
     elif action == 'destroy':
         try:
             rospy.sleep(1)
             delete_gazebo_models()
             rospy.sleep(2)
-            return HandleEnvironmentSrvResponse(1)
+            return HandleEnvironmentSrvResponse(1, False)
         except rospy.ServiceException, e:
             rospy.logerr("Destroy environment call failed: {0}".format(e))
-            return HandleEnvironmentSrvResponse(0)
+            return HandleEnvironmentSrvResponse(0, False)
 
     elif action == 'restart':
         try:
-            rospy.sleep(1)
-            delete_gazebo_models()
-            rospy.sleep(2)
-            load_gazebo_models(environment)
-            rospy.sleep(4)
-            return HandleEnvironmentSrvResponse(1)
+            moveToStartProxy('both')
+            if skip_reset(environment):
+                return HandleEnvironmentSrvResponse(1, True)
+            start = time.time()
+            changed = load_gazebo_models(environment, move_home=False)
+            rospy.sleep(SPAWN_SETTLE if changed else RESET_SETTLE)
+            capture_canonical_state(environment)
+            duration = time.time() - start
+            resetStats.record('reset', duration)
+            if not changed:
+                reset_costs[environment] = duration
+            return HandleEnvironmentSrvResponse(1, False)
 
         except rospy.ServiceException, e:
             rospy.logerr("Destroy environment call failed: {0}".format(e))
-            return HandleEnvironmentSrvResponse(0)
+            return HandleEnvironmentSrvResponse(0, False)
     else:
         print('No Action')
-        return HandleEnvironmentSrvResponse(0)
+        return HandleEnvironmentSrvResponse(0, False)
 
 
 def main():
@@ -266,7 +333,10 @@ def main():
     rospy.wait_for_service('move_to_start_srv', timeout=60)
     rospy.wait_for_service('/gazebo/delete_model', timeout=60)
     
+    cache_model_xml()
+    find_existing_models()
     s = rospy.Service("load_environment", HandleEnvironmentSrv, handle_environment_request)
+    rospy.Service("reset_stats_srv", LatencyStatsSrv, getResetStats)
     load_gazebo_models()
 
     rospy.spin()
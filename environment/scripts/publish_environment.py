@@ -17,6 +17,8 @@ from gazebo_msgs.srv import (
 )
 from gazebo_msgs.msg import (
     LinkState,
+    LinkStates,
+    ModelStates,
 )
 from geometry_msgs.msg import (
     PoseStamped,
@@ -28,196 +30,151 @@ from std_msgs.msg import (
     Header,
     Empty,
     Bool,
+    String,
 )
 
 import tf
 from tf.transformations import *
 
 from environment.srv import * 
+from environment.msg import WorldState
 from agent.srv import MoveToStartSrv
+from util.scenario_objects import *
+from util.data_conversion import worldStateArrays
 
 pub_all = None
 environment = 'default'
 
+# 'topics': poses come from gazebo's aggregated /gazebo/model_states and 
+# /gazebo/link_states streams; the callbacks only keep the latest message and 
+# each tick computes every pose from it in one pass. 
+# 'services': one get_model_state / get_link_state round trip per object per tick. 
+INGESTION_MODE = 'topics'
+PUBLISH_RATE = 10 # hz
+
 getModelState = rospy.ServiceProxy('/gazebo/get_model_state', GetModelState)
 getLinkState = rospy.ServiceProxy('/gazebo/get_link_state', GetLinkState)
 
-pub_cafe_table_pose = rospy.Publisher('cafe_table_pose', PoseStamped, queue_size = 10)
-pub_block_pose = rospy.Publisher('block_pose', PoseStamped, queue_size = 10)
-pub_left_gripper_pose = rospy.Publisher('left_gripper_pose', PoseStamped, queue_size = 10)
-pub_right_gripper_pose = rospy.Publisher('right_gripper_pose', PoseStamped, queue_size = 10)
-pub_breakable_obj_pose = rospy.Publisher('breakable_obj_pose', PoseStamped, queue_size = 10)
-pub_cup_pose = rospy.Publisher('cup_pose', PoseStamped, queue_size = 10)
-pub_cover_pose = rospy.Publisher('cover_pose', PoseStamped, queue_size = 10)
-pub_burner_pose = rospy.Publisher('burner1_pose', PoseStamped, queue_size = 10)
-pub_left_button_pose = rospy.Publisher('left_button_pose', PoseStamped, queue_size = 10)
-pub_right_button_pose = rospy.Publisher('right_button_pose', PoseStamped, queue_size = 10)
-
-def poseFromPoint(poseVar):
-    newPose = poseVar.pose
-    newPose.position.z -= 0.93
-    q_orientation = quaternion_from_euler(3.14, 0, 0).tolist()
-    newPose.orientation = Quaternion(q_orientation [0], q_orientation [1], q_orientation [2],q_orientation [3])
-    newPoseStamped = PoseStamped(header = poseVar.header, pose = newPose)
-    return newPoseStamped
-
-def publish(environment='default'):
+# All poses of a tick go out as one WorldState; only the active scenario's objects are queried
+worldStatePublisher = rospy.Publisher(WORLD_STATE_TOPIC, WorldState, queue_size = 10)
+active = list(OBJECTS)
+
+# gazebo's state topics carry no stamp, so each tick is stamped with when its 
+# inputs arrived here: the older of the latest model_states and link_states 
+# receipts (sim time) 
+latest_model_states = None
+latest_link_states = None
+model_states_stamp = None
+link_states_stamp = None
+
+def setActiveScenario(data):
+    global active
+    active = active_objects(data.data)
+
+def setModelStates(data):
+    global latest_model_states
+    global model_states_stamp
+    latest_model_states = data
+    model_states_stamp = rospy.Time.now()
+
+def setLinkStates(data):
+    global latest_link_states
+    global link_states_stamp
+    latest_link_states = data
+    link_states_stamp = rospy.Time.now()
+
+q_orientation = quaternion_from_euler(3.14, 0, 0).tolist()
+
+def poseFromPoint(pose):
+    return Pose(position=Point(pose.position.x, pose.position.y, pose.position.z - 0.93),
+                orientation=Quaternion(q_orientation [0], q_orientation [1], q_orientation [2],q_orientation [3]))
+
+# Gripper pose: midpoint of the finger links
+def poseFromLinks(link_poses):
+    pose = Pose()
+    pose.position.x = sum(p.position.x for p in link_poses)/len(link_poses)
+    pose.position.y = sum(p.position.y for p in link_poses)/len(link_poses)
+    pose.position.z = sum(p.position.z for p in link_poses)/len(link_poses)
+    pose.orientation = link_poses[0].orientation # TODO get the actual gripper orientation
+    return pose
+
+def objectPose(obj, model_pose=None, link_poses=None):
+    if obj.model is not None:
+        return poseFromPoint(model_pose) if obj.from_point else model_pose
+    return poseFromLinks(link_poses)
+
+# [(name, Pose)] for the active objects, from the latest gazebo state messages
+def posesFromTopics():
+    model_states = latest_model_states
+    link_states = latest_link_states
+    if model_states is None or link_states is None:
+        return []
+    models = dict(zip(model_states.name, model_states.pose))
+    # Link names are scoped, e.g. 'baxter::l_gripper_l_finger'
+    links = dict((name.split('::')[-1], pose) for name, pose in zip(link_states.name, link_states.pose))
+
+    poses = []
+    for name in active:
+        obj = OBJECTS[name]
+        if obj.model is not None:
+            if obj.model in models:
+                poses.append((name, objectPose(obj, model_pose=models[obj.model])))
+        elif all(link in links for link in obj.links):
+            poses.append((name, objectPose(obj, link_poses=[links[link] for link in obj.links])))
+    return poses
+
+# [(name, Pose)] for the active objects, one service call per model/link
+def posesFromServices():
+    poses = []
+    for name in active:
+        obj = OBJECTS[name]
+        try:
+            if obj.model is not None:
+                poses.append((name, objectPose(obj, model_pose=getModelState(obj.model, "").pose)))
+            else:
+                link_poses = [getLinkState(link, 'world').link_state.pose for link in obj.links]
+                poses.append((name, objectPose(obj, link_poses=link_poses)))
+        except rospy.ServiceException as e:
+            rospy.logerr("get_model_state/get_link_state for {0} service call failed: {1}".format(name, e))
+    return poses
+
+def publish(environment='default', ingestion=INGESTION_MODE):
     # rospy.wait_for_message("/models_loaded", Bool) 
     
     frameid_var = "/world"
+    if ingestion == 'topics':
+        poses = posesFromTopics()
+        source_stamp = min(model_states_stamp, link_states_stamp) if len(poses) > 0 else None
+    else:
+        source_stamp = rospy.Time.now()
+        poses = posesFromServices()
+    if len(poses) == 0:
+        return
 
-    try:
-        resp_cafe_table_ms = getModelState("cafe_table", "");
-        pose_cafe_table = resp_cafe_table_ms.pose
-        # pose_cafe_table.position.z += 0.7
-        header_cafe_table = resp_cafe_table_ms.header
-        header_cafe_table.frame_id = frameid_var
-        poseStamped_cafe_table = PoseStamped(header=header_cafe_table, pose=pose_cafe_table)
-        pub_cafe_table_pose.publish(poseStamped_cafe_table)
-
-    except rospy.ServiceException as e:
-        rospy.logerr("get_model_state for cafe_table service call failed: {0}".format(e))
-
-    # try:
-    #     resp_breakable_obj_ms = getModelState("breakable_obj", ""); 
-    #     pose_breakable_obj = resp_breakable_obj_ms.pose
-    #     header_breakable_obj = resp_breakable_obj_ms.header
-    #     header_breakable_obj.frame_id = frameid_var
-    #     poseStamped_breakable_obj = PoseStamped(header=header_breakable_obj, pose=pose_breakable_obj)
-    #     pub_breakable_obj_pose.publish(poseFromPoint(poseStamped_breakable_obj))
-    # except rospy.ServiceExceptin as e:
-    #     rospy.logerr("get_model_state for block service call failed: {0}".format(e))
-
-    try:
-        resp_cover_ms = getModelState("cover", "");
-        pose_cover = resp_cover_ms.pose
-        header_cover = resp_cover_ms.header
-        header_cover.frame_id = frameid_var
-        poseStamped_cover = PoseStamped(header=header_cover, pose=pose_cover)
-        pub_cover_pose.publish(poseFromPoint(poseStamped_cover))
-    except rospy.ServiceException, e:
-        rospy.logerr("get_model_state for block service call failed: {0}".format(e))
-
-    try:
-        resp_cup_ms = getModelState("cup", "");
-        pose_cup = resp_cup_ms.pose
-        header_cup = resp_cup_ms.header
-        header_cup.frame_id = frameid_var
-        poseStamped_cup = PoseStamped(header=header_cup, pose=pose_cup)
-        pub_cup_pose.publish(poseFromPoint(poseStamped_cup))
-    except rospy.ServiceException, e:
-
-        rospy.logerr("get_model_state for block service call failed: {0}".format(e))
-
-
-    try:
-        resp_burner_ms = getModelState("burner1", "");
-        pose_burner = resp_burner_ms.pose
-        header_burner = resp_burner_ms.header
-        header_burner.frame_id = frameid_var
-        poseStamped_burner = PoseStamped(header=header_burner, pose=pose_burner)
-        pub_burner_pose.publish(poseFromPoint(poseStamped_burner))
-    except rospy.ServiceException, e:
-        rospy.logerr("get_model_state for block service call failed: {0}".format(e))
-
-    try:
-        resp_left_button_ms = getModelState("left_button", "");
-        pose_left_button = resp_left_button_ms.pose
-        header_left_button = resp_left_button_ms.header
-        header_left_button.frame_id = frameid_var
-        poseStamped_left_button = PoseStamped(header=header_left_button, pose=pose_left_button)
-        pub_left_button_pose.publish(poseFromPoint(poseStamped_left_button))
-    except rospy.ServiceException, e:
-        rospy.logerr("get_model_state for block service call failed: {0}".format(e))
-
-    try:
-        resp_right_button_ms = getModelState("right_button", "");
-        pose_right_button = resp_right_button_ms.pose
-        header_right_button = resp_right_button_ms.header
-        header_right_button.frame_id = frameid_var
-        poseStamped_right_button = PoseStamped(header=header_right_button, pose=pose_right_button)
-        pub_right_button_pose.publish(poseFromPoint(poseStamped_right_button))
-    except rospy.ServiceException, e:
-        rospy.logerr("get_model_state for block service call failed: {0}".format(e))
-
- ######################################################################################
- ####### START: Gripper pose processing
-
-    pose_lglf = None
-    pose_lgrf = None
-    pose_rglf = None
-    pose_rgrf = None
-
-    hdr = Header(frame_id=frameid_var)
-
-    try:
-        resp_lglf_link_state = getLinkState('l_gripper_l_finger', 'world')
-        pose_lglf = resp_lglf_link_state.link_state.pose
-    except rospy.ServiceException as e:
-        rospy.logerr("get_link_state for l_gripper_l_finger: {0}".format(e))
-    try:
-        resp_lgrf_link_state = getLinkState('l_gripper_r_finger', 'world')
-        pose_lgrf = resp_lgrf_link_state.link_state.pose
-    except rospy.ServiceException, e:
-        rospy.logerr("get_link_state for l_gripper_r_finger: {0}".format(e))
-
-    try:
-        leftGripperPose = Pose()
-        leftGripperPose.position.x = (pose_lglf.position.x + pose_lgrf.position.x)/2
-        leftGripperPose.position.y = (pose_lglf.position.y + pose_lgrf.position.y)/2
-        leftGripperPose.position.z = (pose_lglf.position.z + pose_lgrf.position.z)/2
-
-        leftGripperPose.orientation = pose_lglf.orientation # TODO get the actual gripper orientation
-        
-        poseStamped_left_gripper = PoseStamped(header=hdr, pose=leftGripperPose)
-        pub_left_gripper_pose.publish(poseStamped_left_gripper)
-    except rospy.ServiceException, e:
-        rospy.logerr("Unable to calculate calibrated position: {0}".format(e))
-
-    try:
-        resp_rglf_link_state = getLinkState('r_gripper_l_finger', 'world')
-        lglf_reference = resp_lglf_link_state.link_state.reference_frame
-        pose_rglf = resp_rglf_link_state.link_state.pose
-    except rospy.ServiceException, e:
-        rospy.logerr("get_link_state for r_gripper_l_finger: {0}".format(e))
-    try:
-        resp_rgrf_link_state = getLinkState('r_gripper_r_finger', 'world')
-        pose_rgrf = resp_rgrf_link_state.link_state.pose
-    except rospy.ServiceException, e:
-        rospy.logerr("get_link_state for r_gripper_r_finger: {0}".format(e))
-
-    try:
-        rightGripperPose = Pose()
-        rightGripperPose.position.x = (pose_rglf.position.x + pose_rgrf.position.x)/2
-        rightGripperPose.position.y = (pose_rglf.position.y + pose_rgrf.position.y)/2
-        rightGripperPose.position.z = (pose_rglf.position.z + pose_rgrf.position.z)/2
-        rightGripperPose.orientation = pose_rgrf.orientation # TODO get the actual gripper orientation
-    
-        poseStamped_right_gripper = PoseStamped(header=hdr, pose=rightGripperPose)
-        pub_right_gripper_pose.publish(poseStamped_right_gripper)
-    except rospy.ServiceException, e:
-        rospy.logerr("Unable to calculate calibrated position: {0}".format(e))
-
-
-####### END: Gripper pose processing
-######################################################################################
+    hdr = Header(stamp=rospy.Time.now(), frame_id=frameid_var)
+    names, positions, orientations = worldStateArrays(poses)
+    worldStatePublisher.publish(WorldState(hdr, source_stamp, names, positions, orientations))
 
 
 def main():
 
     rospy.init_node("publish_environment_node")
-    rospy.wait_for_service('/gazebo/get_model_state')
-    rospy.wait_for_service('/gazebo/get_link_state')
+    ingestion = rospy.get_param('~ingestion', INGESTION_MODE)
+    rate = rospy.Rate(rospy.get_param('~rate', PUBLISH_RATE))
 
-    rate = rospy.Rate(10) # 10hz
+    rospy.Subscriber(ACTIVE_SCENARIO_TOPIC, String, setActiveScenario)
+    if ingestion == 'topics':
+        rospy.Subscriber('/gazebo/model_states', ModelStates, setModelStates, queue_size = 1)
+        rospy.Subscriber('/gazebo/link_states', LinkStates, setLinkStates, queue_size = 1)
+    else:
+        rospy.wait_for_service('/gazebo/get_model_state')
+        rospy.wait_for_service('/gazebo/get_link_state')
 
     rospy.wait_for_message("/models_loaded", Bool)
     
     while not rospy.is_shutdown():
-        publish()
+        publish(ingestion=ingestion)
         rate.sleep()
 
 if __name__ == '__main__':
     sys.exit(main())
-
-
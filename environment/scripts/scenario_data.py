@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 
 import rospy
-
+import math
+import time
+import threading
 
 from gazebo_msgs.msg import (
     LinkState,
@@ -16,255 +18,403 @@ from geometry_msgs.msg import (
     
 )
 
-from std_msgs.msg import Bool
+from std_msgs.msg import (
+    Bool,
+    Header,
+    String,
+)
 
 import baxter_interface
 
 from environment.srv import *
 from environment.msg import *
-from util.image_converter import ImageConverter
+from agent.msg import VisibleObjects, ColorDetections
 from util.data_conversion import *
+from util.spatial_relations import ContactTable
+from util.scenario_objects import *
+from util.predicate_rules import *
+from util.state_timeline import StateTimeline
+from util.latency_stats import LatencyStats
 
 predicatesPublisher = rospy.Publisher('predicate_values', PredicateList, queue_size = 10)
-imageConverter = ImageConverter()
-# isVisible = rospy.ServiceProxy('is_visible_srv', IsVisibleSrv)
-
-CupPose = None
-CoverPose = None
-LeftGripperPose = None
-RightGripperPose = None
-TablePose = None
-BurnerPose = None
-RightButtonPose = None
-LeftButtonPose = None
-# Breakable_Obj_Pose = None
+predicateDeltaPublisher = rospy.Publisher('predicate_deltas', PredicateDelta, queue_size = 100)
 
 cover_pressed = False
 cup_pressed = False
 require_burner_on = False
-left_button_pressed = False
-right_button_pressed = False
 
 
 predicates_list = []
 
+# The world state callback only stores the latest poses and flags the state as 
+# dirty. The predicates are recomputed at most once per tick of the update timer, and only 
+# if a pose (or object visibility) changed since the last tick. 
+PREDICATE_UPDATE_RATE = 10.0 # hz
+visible_objects = []
+camera_visible = [] # objects the vision node currently sees
+dirty_since = None # sim time of the first change not yet in a snapshot
+
+# Per-hop latency of the state pipeline (sim time): 
+#   sample     gazebo state received -> WorldState published (publish_environment)
+#   transport  WorldState published -> received here
+#   rebuild    first unprocessed change -> snapshot published
+#   read       gazebo state behind the served snapshot received -> service answered
+LATENCY_HOPS = ['sample', 'transport', 'rebuild', 'read']
+latencyStats = LatencyStats(LATENCY_HOPS)
+latest_source_stamp = None # source stamp of the newest world tick applied
+
+# Objects of the active scenario. Until load_environment announces one, every 
+# known object is tracked. Poses of other objects in a WorldState are ignored. 
+objectRegistry = ObjectRegistry()
+
+# Contact relations (util.scenario_objects), evaluated for all pairs at once 
+# over an N x 3 position array. 
+CONTACT_OBJECTS = objectRegistry.names
+# The grid index only beats dense evaluation from ~100 objects on 
+# (test/scripts/benchmark_contact_index.py); smaller scenes stay dense. 
+CONTACT_GRID_CELL_SIZE = 0.1 # m
+CONTACT_GRID_MIN_OBJECTS = 100
+
+contactTable = ContactTable(CONTACT_OBJECTS, TOUCHING_PAIRS, PRESSING_PAIRS, 
+                            CONTACT_GRID_CELL_SIZE if len(CONTACT_OBJECTS) >= CONTACT_GRID_MIN_OBJECTS else None)
+CONTACT_FACTS = [('contact',) + pair for pair in contactTable.touching_pairs]
+PRESS_FACTS = [('press',) + pair for pair in contactTable.pressing_pairs]
+
+ruleEngine = RuleEngine(physical_state_rules(contactTable.touching_pairs))
+PHYSICAL_OPERATORS = ['pressed', 'obtained', 'touching', 'on', 'on_burner', 'covered', 'cooking', 'powered_on'] #grasped?
+
+# Versioned snapshots of the pddl init state. A new version is only cut when the 
+# set of init strings actually changes; the last STATE_HISTORY_LENGTH versions 
+# are kept so that clients can ask for a diff since any recent version. 
+STATE_HISTORY_LENGTH = 100
+
+# The same versions indexed by the sim time of the world tick they were computed 
+# from, so clients can ask for the state at an instant instead of sampling 
+# scenario_data_srv around it. state_at_time_srv waits (up to 
+# STATE_AT_TIME_TIMEOUT) until a tick received at or after the instant is in. 
+STATE_TIMELINE_LENGTH = 1000
+STATE_AT_TIME_POLL = 0.1    # s, the update period
+STATE_AT_TIME_TIMEOUT = 2.0 # s
+stateTimeline = StateTimeline(STATE_TIMELINE_LENGTH)
+
+# Representations served by scenario_data_srv. Each is only built when a caller 
+# asks for it, and is cached until the next predicate update. 
+SCENARIO_DATA_FIELDS = ['predicates', 'objects', 'init', 'predicateList']
+field_formatters = {'predicates' : pddlStringFormat,
+                    'objects' : pddlObjectsStringFormat,
+                    'init' : pddlInitStringFormat,
+                    'predicateList' : lambda preds: PredicateList(list(preds))}
+
+# rospy runs every callback and service handler on its own thread. Writers 
+# (pose callbacks, the update timer, reset) serialize on update_lock and work on 
+# writer-owned state (predicates_list, the registry, the contact table). Each 
+# update ends by publishing a new immutable Snapshot through the current_snapshot 
+# reference; the services read that reference once and never lock. 
+update_lock = threading.Lock()
+
+class Snapshot(object):
+    def __init__(self, version, predicates, init, history, source_stamp):
+        self.version = version
+        self.predicates = predicates # tuple of Predicate
+        self.init = init             # frozenset of init strings
+        self.history = history       # {version : init}, never mutated once published
+        self.fields = {}             # formatted on demand; racing fills write the same value
+        # Sim time publish_environment received the newest gazebo state this holds for. The 
+        # one field that moves (forward) after publishing, as unchanged ticks arrive. 
+        self.source_stamp = source_stamp
+
+    def field(self, name):
+        if name not in self.fields:
+            self.fields[name] = field_formatters[name](self.predicates)
+        return self.fields[name]
+
+current_snapshot = Snapshot(0, (), frozenset(), {0 : frozenset()}, rospy.Time())
+
 ########################################################
-def setPoseCup(data):
-    global CupPose
-    CupPose = data
-    updatePredicates("cup", data)
-
-def setPoseCover(data):
-    global CoverPose
-    CoverPose = data
-    updatePredicates("cover", data)
-
-def setPoseGripperLeft(data):
-    global LeftGripperPose
-    translate(data)
-    LeftGripperPose = data
-    updatePredicates("left_gripper", data)    
-
-def setPoseGripperRight(data):
-    global RightGripperPose
-    translate(data)
-    RightGripperPose = data
-    updatePredicates("right_gripper", data)    
-
-def setPoseTable(data):
-    global TablePose
-    translate(data, -0.2)
-    TablePose = data
-    updatePredicates("table", data)
-
-def setPoseBurner(data):
-    global BurnerPose
-    # translate(data, -0.2)
-    BurnerPose = data
-    updatePredicates("burner1", data)
-
-def setPoseLeftButton(data):
-    global LeftButtonPose
-    LeftButtonPose = data
-    updatePredicates("left_button", data)
-
-def setPoseRightButton(data):
-    global RightButtonPose
-    RightButtonPose = data
-    updatePredicates("right_button", data)
-
-# def setPoseBreakable_Obj(data):
-#     global Breakable_Obj_Pose
-#     Breakable_Obj_Pose = data
-#     updatePredicates("breakable_obj", data)
+# One whole-world tick: every pose is applied before the state is flagged, so 
+# the next update never mixes poses from different ticks 
+def setWorldState(data):
+    global latest_source_stamp
+    latencyStats.record('sample', (data.header.stamp - data.source_stamp).to_sec())
+    latencyStats.record('transport', (rospy.Time.now() - data.header.stamp).to_sec())
+    with update_lock:
+        changed = False
+        for obj, pose in worldStatePoses(data):
+            if objectRegistry.is_active(obj):
+                changed = storePose(obj, PoseStamped(header=data.header, pose=pose)) or changed
+        latest_source_stamp = data.source_stamp
+        if changed:
+            flagDirty()
+        elif dirty_since is None:
+            current_snapshot.source_stamp = data.source_stamp
+
+def setActiveScenario(data):
+    with update_lock:
+        activateObjects(active_objects(data.data))
+
+# Caller holds update_lock (or is main, before any callbacks)
+def activateObjects(names):
+    added, removed = objectRegistry.activate(names)
+    for obj in removed:
+        contactTable.remove_position(obj)
+    if len(added) > 0 or len(removed) > 0:
+        flagDirty()
 
 def set_require_burner_on(data):
     global require_burner_on
-    require_burner_on = data
+    with update_lock:
+        require_burner_on = data
+        flagDirty()
 
 def translate(objPose, z_amt=-1.0):
     objPose.pose.position.z += z_amt
 
-########################################################
+# Returns whether the pose changed. Caller holds update_lock. 
+def storePose(obj, locInf):
+    z_offset = OBJECTS[obj].z_offset
+    if z_offset != 0.0:
+        translate(locInf, z_offset)
+    previous = objectRegistry.set_pose(obj, locInf)
+    position = locInf.pose.position
+    contactTable.set_position(obj, (position.x, position.y, position.z))
+    return (previous is None) or (previous.pose != locInf.pose)
+
+# Caller holds update_lock
+def flagDirty():
+    global dirty_since
+    if dirty_since is None:
+        dirty_since = rospy.get_time()
 
-# Jumping off point for updates. "Master" list 
-def updatePredicates(obj, locInf):
-    updateLocationPredicates("at", obj, locInf)
-    updateVisionBasedPredicates()
-    updatePhysicalStateBasedPredicates()
-    predicatesPublisher.publish(predicates_list)
+########################################################
 
-def updateLocationPredicates(oprtr, obj, locInf):
+# Jumping off point for updates. "Master" list. Runs on the update timer. 
+def updatePredicates(event=None):
+    global dirty_since
+    visible = getVisibleObjectNames()
+    with update_lock:
+        if (dirty_since is None) and (visible == visible_objects):
+            return
+
+        # Poses arriving mid-update wait on the lock and are picked up on 
+        # the next tick 
+        started = dirty_since if dirty_since is not None else rospy.get_time()
+        dirty_since = None
+
+        updateLocationPredicates("at")
+        updateVisionBasedPredicates(visible)
+        updatePhysicalStateBasedPredicates()
+        delta = updateStateVersion()
+        published = list(predicates_list)
+    predicatesPublisher.publish(published)
+    if delta is not None:
+        predicateDeltaPublisher.publish(delta)
+    recordUpdateLatency(rospy.get_time() - started)
+
+def recordUpdateLatency(latency):
+    latencyStats.record('rebuild', latency)
+    rebuild = latencyStats.get('rebuild')
+    rospy.logdebug("Predicate update latency: {0:.4f}s (p95 <= {1:.3f}s, max {2:.4f}s over {3} updates)".format(
+                   latency, rebuild.quantile(0.95), rebuild.max, rebuild.count))
+
+# Publishes the snapshot for the current predicates_list. Returns the 
+# PredicateDelta to send if the init state changed. Caller holds update_lock. 
+def updateStateVersion():
+    global current_snapshot
+    previous = current_snapshot
+    init_list = pddlInitStringFormat(predicates_list)
+    new_init = frozenset(init_list)
+    version, history = previous.version, previous.history
+    delta = None
+    source_stamp = latest_source_stamp if latest_source_stamp is not None else previous.source_stamp
+    if new_init != previous.init:
+        version += 1
+        history = dict(history)
+        history[version] = new_init
+        history.pop(version - STATE_HISTORY_LENGTH, None)
+        stamp = max(source_stamp, stateTimeline.last_stamp())
+        stateTimeline.append(stamp, version, new_init)
+        delta = PredicateDelta(Header(stamp=stamp),
+                               version, 
+                               version - 1, 
+                               sorted(new_init - previous.init), 
+                               sorted(previous.init - new_init))
+    snapshot = Snapshot(version, tuple(predicates_list), new_init, history, source_stamp)
+    snapshot.fields['init'] = init_list
+    current_snapshot = snapshot
+    return delta
+
+def updateLocationPredicates(oprtr):
     global predicates_list
     new_predicates = []
     for pred in predicates_list:
-        if not((pred.operator == oprtr) and (obj in pred.objects)): ## This needs to change
+        if not (pred.operator == oprtr):
             new_predicates.append(pred)
-    new_predicates.append(Predicate(operator=oprtr, objects=[obj], locationInformation=locInf)) 
+    for obj, locInf in objectRegistry.items():
+        new_predicates.append(Predicate(operator=oprtr, objects=[obj], locationInformation=locInf)) 
     predicates_list = new_predicates
 
-def updateVisionBasedPredicates():
+# Need to update the image converter to deal with more objects and to be more sophisticated. 
+# For the image recognition part, every object MUST have a different color to identify it  
+def getVisibleObjectNames():
+    return [obj for obj in ['cup', 'cover'] if objectRegistry.is_active(obj) and obj in camera_visible]
+
+def setVisibleObjects(data):
+    global camera_visible
+    with update_lock:
+        camera_visible = list(data.objects)
+        flagDirty()
+
+# Cross-checks the tracked poses against where the camera sees each object 
+# (its largest blob, projected onto the table top). The projection is of the 
+# blob's centroid, so it is only good to a few cm. 
+DETECTION_TOLERANCE = 0.1 # m
+def checkDetections(data):
+    if len(data.table_points) == 0:
+        return
+    largest = {}
+    for i, obj in enumerate(data.objects):
+        if obj != '' and ((obj not in largest) or (data.areas[i] > data.areas[largest[obj]])):
+            largest[obj] = i
+    tracked = dict(objectRegistry.items())
+    for obj, i in largest.items():
+        if obj not in tracked:
+            continue
+        position = tracked[obj].pose.position
+        error = math.hypot(data.table_points[2*i] - position.x, data.table_points[2*i+1] - position.y)
+        if error > DETECTION_TOLERANCE:
+            rospy.logwarn_throttle(5, "{0} seen {1:.3f}m from its tracked position".format(obj, error))
+
+def updateVisionBasedPredicates(visible):
     global predicates_list
+    global visible_objects
     new_predicates = []
     for pred in predicates_list:
         if not (pred.operator == "is_visible"):
             new_predicates.append(pred)
 
-    # Need to update the image converter to deal with more objects and to be more sophisticated. 
-    # For the image recognition part, every object MUST have a different color to identify it  
-    if (imageConverter.is_visible('cup') == True):
-        new_predicates.append(Predicate(operator="is_visible", objects=["cup"], locationInformation=None)) 
-    if (imageConverter.is_visible('cover') == True):
-        new_predicates.append(Predicate(operator="is_visible", objects=["cover"], locationInformation=None)) 
+    for obj in visible:
+        new_predicates.append(Predicate(operator="is_visible", objects=[obj], locationInformation=None)) 
     
+    visible_objects = visible
     predicates_list = new_predicates
 
 def updatePhysicalStateBasedPredicates():
-    physical_operators = ['pressed', 'obtained', 'touching', 'on', 'on_burner', 'covered', 'cooking', 'powered_on'] #grasped?
-
-    # Physical state choices
     global predicates_list
-    global left_button_pressed
-    global right_button_pressed
+
+    touching_mask, pressed_mask = contactTable.evaluate()
+    ruleEngine.set_mask('contact', CONTACT_FACTS, touching_mask)
+    ruleEngine.set_mask('press', PRESS_FACTS, pressed_mask)
+    # require_burner_on holds the Bool message once one has been received
+    ruleEngine.set_input(('require_burner_on',), not (require_burner_on == False))
+    if len(ruleEngine.update()) == 0:
+        return
 
     new_predicates = []
     for pred in predicates_list:
-        if pred.operator not in physical_operators:
+        if pred.operator not in PHYSICAL_OPERATORS:
             new_predicates.append(pred)
 
-    if is_touching(LeftGripperPose, TablePose, 1.0, 0.1):
-        new_predicates.append(Predicate(operator="touching", objects=['left_gripper', 'table'], locationInformation=None)) 
-    if is_touching(RightGripperPose, TablePose, 1.0, 0.1):
-        new_predicates.append(Predicate(operator="touching", objects=['right_gripper', 'table'], locationInformation=None)) 
-    if is_touching(CupPose, TablePose, 1.0, 0.1):
-        new_predicates.append(Predicate(operator="touching", objects=['cup', 'table'], locationInformation=None)) 
-    if is_touching(CoverPose, TablePose, 1.0, 0.1):
-        new_predicates.append(Predicate(operator="touching", objects=['cover', 'table'], locationInformation=None)) 
-    if is_touching(CoverPose, CupPose, 0.1):
-        new_predicates.append(Predicate(operator="touching", objects=['cover', 'cup'], locationInformation=None)) 
-    if is_touching(LeftGripperPose, CoverPose, 0.1):
-        new_predicates.append(Predicate(operator="touching", objects=['left_gripper', 'cover'], locationInformation=None)) 
-    if is_touching(RightGripperPose, CoverPose, 0.1):
-        new_predicates.append(Predicate(operator="touching", objects=['right_gripper', 'cover'], locationInformation=None)) 
-
-    if is_pressed(LeftGripperPose, LeftButtonPose, 0.08, [0.07, None]):
-        left_button_pressed = True
-    if is_pressed(RightGripperPose, LeftButtonPose, 0.08, [0.07, None]):
-        left_button_pressed = True
-    if is_pressed(LeftGripperPose, RightButtonPose, 0.08, [0.07, None]):
-        right_button_pressed = True
-    if is_pressed(RightGripperPose, RightButtonPose, 0.08, [0.07, None]):
-        right_button_pressed = True
-
-
-    item_on_burner = []
-    covered_item = []
-    burner_on = False
-
-    if is_touching(CoverPose, BurnerPose, 0.1, 0.06):
-        new_predicates.append(Predicate(operator="touching", objects=['cover', 'burner1'], locationInformation=None)) 
-        new_predicates.append(Predicate(operator="on_burner", objects=['cover', 'burner1'], locationInformation=None)) 
-        item_on_burner.append('cover')
-
-    if is_touching(CupPose, BurnerPose, 0.1, 0.06):
-        new_predicates.append(Predicate(operator="touching", objects=['cup', 'burner1'], locationInformation=None)) 
-        new_predicates.append(Predicate(operator="on_burner", objects=['cup', 'burner1'], locationInformation=None)) 
-        item_on_burner.append('cup')
-
-    if is_pressed(CupPose, CoverPose, 0.1, [0.07, None]):
-        new_predicates.append(Predicate(operator="covered", objects=['cover'], locationInformation=None)) 
-        covered_item.append('cover')
-
-    if is_pressed(CoverPose, CupPose, 0.1, [0.07, None]):
-        new_predicates.append(Predicate(operator="covered", objects=['cup'], locationInformation=None)) 
-        covered_item.append('cup')
-
-    if right_button_pressed == True:
-        new_predicates.append(Predicate(operator="pressed", objects=['left_button'], locationInformation=None)) 
-        new_predicates.append(Predicate(operator="powered_on", objects=['burner1'], locationInformation=None)) 
-        burner_on = True
-
-    if right_button_pressed == True:
-        new_predicates.append(Predicate(operator="pressed", objects=['right_button'], locationInformation=None)) 
-
-    if item_on_burner is not []:
-        for item in item_on_burner:
-            if (item in covered_item) == True:
-                if require_burner_on == False:
-                    new_predicates.append(Predicate(operator="cooking", objects=[item], locationInformation=None)) 
-                elif burner_on == True:
-                    new_predicates.append(Predicate(operator="cooking", objects=[item], locationInformation=None)) 
+    for fact in ruleEngine.true_facts():
+        new_predicates.append(Predicate(operator=fact[0], objects=list(fact[1:]), locationInformation=None)) 
 
     predicates_list = new_predicates
 
 
-def getPredicates(data):
-    return ScenarioDataSrvResponse(pddlStringFormat(predicates_list), 
-                                   pddlObjectsStringFormat(predicates_list),
-                                   pddlInitStringFormat(predicates_list),
-                                   PredicateList(predicates_list))
+# An empty field list returns every representation
+def getPredicates(req):
+    snapshot = current_snapshot
+    recordReadLatency(snapshot)
+    fields = req.fields if len(req.fields) > 0 else SCENARIO_DATA_FIELDS
+    resp = ScenarioDataSrvResponse()
+    resp.version = snapshot.version
+    resp.source_stamp = snapshot.source_stamp
+    for field in fields:
+        if field in field_formatters:
+            setattr(resp, field, snapshot.field(field))
+        else:
+            rospy.logwarn("scenario_data_srv: unknown field '{0}'".format(field))
+    return resp
+
+# Returns only the init atoms added/removed since the requested version. If that 
+# version is unknown (negative, or fallen out of the history) the full state is 
+# returned in 'added' with full_state set, which doubles as a resync. 
+# source_stamp is that of the newest world tick the state accounts for. 
+def getPredicateDiff(req):
+    snapshot = current_snapshot
+    recordReadLatency(snapshot)
+    since = snapshot.history.get(req.since_version)
+    if since is None:
+        return ScenarioDataDiffSrvResponse(snapshot.version, True, sorted(snapshot.init), [], snapshot.source_stamp)
+    return ScenarioDataDiffSrvResponse(snapshot.version, 
+                                       False, 
+                                       sorted(snapshot.init - since), 
+                                       sorted(since - snapshot.init), 
+                                       snapshot.source_stamp)
+
+def recordReadLatency(snapshot):
+    if snapshot.source_stamp != rospy.Time():
+        latencyStats.record('read', (rospy.Time.now() - snapshot.source_stamp).to_sec())
+
+def getLatencyStats(req):
+    return LatencyStatsSrvResponse([LatencyHistogram(hop, h.edges, h.counts, h.count, h.mean(), h.max) 
+                                    for hop, h in latencyStats.snapshot(req.reset)])
+
+def stateSnapshotMsg(entry):
+    stamp, version, init = entry
+    return StateSnapshot(Header(stamp=stamp), version, sorted(init))
+
+def getStateAtTime(req):
+    deadline = rospy.get_time() + STATE_AT_TIME_TIMEOUT
+    while (current_snapshot.source_stamp < req.stamp) and (rospy.get_time() < deadline):
+        time.sleep(STATE_AT_TIME_POLL)
+    if current_snapshot.source_stamp < req.stamp:
+        rospy.logwarn("state_at_time_srv: state still behind the requested stamp after {0}s".format(STATE_AT_TIME_TIMEOUT))
+    entry = stateTimeline.at(req.stamp)
+    if entry is None:
+        return StateAtTimeSrvResponse(False, StateSnapshot())
+    return StateAtTimeSrvResponse(True, stateSnapshotMsg(entry))
+
+def getStatesBetween(req):
+    return StatesBetweenSrvResponse([stateSnapshotMsg(entry) for entry in stateTimeline.between(req.start, req.end)])
+
+def getAtomFirstTrue(req):
+    stamp = stateTimeline.first_true(req.atom, req.since)
+    if stamp is None:
+        return AtomFirstTrueSrvResponse(False, rospy.Time())
+    return AtomFirstTrueSrvResponse(True, stamp)
 
 def getObjectLocation(data):
-    obj = data.obj
-    obj_choices = {
-        # 'breakable_obj': Breakable_Obj_Pose,
-        'cup': CupPose,
-        'cover': CoverPose,
-        'left_gripper': LeftGripperPose,
-        'right_gripper': RightGripperPose, 
-        'table': TablePose,
-        'burner1': BurnerPose,
-        'left_button': LeftButtonPose,
-        'right_button': RightButtonPose
-    }
-    return obj_choices.get(obj)
+    return objectRegistry.get_pose(data.obj)
 
 def reset(req):
-    global left_button_pressed
-    global right_button_pressed
-    left_button_pressed = False
-    right_button_pressed = False
+    with update_lock:
+        ruleEngine.reset()
+        flagDirty()
     return True
 
 def main():
     rospy.init_node("scenario_data_node")
+    stateTimeline.append(rospy.Time.now(), current_snapshot.version, current_snapshot.init)
     rospy.wait_for_service('is_visible_srv', timeout=60)
    
-    # rospy.Subscriber("breakable_obj_pose", PoseStamped, setPoseBreakable_Obj)
-    rospy.Subscriber("left_gripper_pose", PoseStamped, setPoseGripperLeft)
-    rospy.Subscriber("right_gripper_pose", PoseStamped, setPoseGripperRight)
-    rospy.Subscriber("cafe_table_pose", PoseStamped, setPoseTable)
-    rospy.Subscriber("burner1_pose", PoseStamped, setPoseBurner)
-    rospy.Subscriber("cup_pose", PoseStamped, setPoseCup)
-    rospy.Subscriber("cover_pose", PoseStamped, setPoseCover)
-    rospy.Subscriber("left_button_pose", PoseStamped, setPoseLeftButton)
-    rospy.Subscriber("right_button_pose", PoseStamped, setPoseRightButton)
+    activateObjects(objectRegistry.names)
+    rospy.Subscriber(ACTIVE_SCENARIO_TOPIC, String, setActiveScenario)
+    rospy.Subscriber(WORLD_STATE_TOPIC, WorldState, setWorldState)
     rospy.Subscriber("require_burner_on", Bool, set_require_burner_on)
+    rospy.Subscriber("visible_objects", VisibleObjects, setVisibleObjects)
+    rospy.Subscriber("color_detections", ColorDetections, checkDetections, queue_size = 1)
 
     rospy.Service("scenario_data_srv", ScenarioDataSrv, getPredicates)
+    rospy.Service("scenario_data_diff_srv", ScenarioDataDiffSrv, getPredicateDiff)
+    rospy.Service("state_at_time_srv", StateAtTimeSrv, getStateAtTime)
+    rospy.Service("states_between_srv", StatesBetweenSrv, getStatesBetween)
+    rospy.Service("atom_first_true_srv", AtomFirstTrueSrv, getAtomFirstTrue)
+    rospy.Service("latency_stats_srv", LatencyStatsSrv, getLatencyStats)
     rospy.Service("object_location_srv", ObjectLocationSrv, getObjectLocation)
     rospy.Service("reset_env_preds", EmptySrvReq, reset)
 
+    rospy.Timer(rospy.Duration(1.0/PREDICATE_UPDATE_RATE), updatePredicates)
+
     rospy.spin()
     
     return 0
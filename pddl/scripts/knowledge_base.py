@@ -9,6 +9,7 @@ from pddl.msg import *
 from agent.srv import *
 
 from util.knowledge_base.knowledge_base import KnowledgeBase, StaticPredicate, Action, Variable
+from util.world_state import parse_atom, split_atom
 
 KB = KnowledgeBase()
 getObjLoc = rospy.ServiceProxy('object_location_srv', ObjectLocationSrv)
@@ -89,16 +90,10 @@ def add_action_to_KB(req):
     assert(len(args) == len(pddl_args))
 
     for i in range(len(new_effects)):
-        effect = new_effects[i]
-        operator = effect[1:].split()[0] if 'not' not in effect else effect[6:].split()[0]
-
-        if 'not' in effect:
-            instatiated_pred_args = effect.replace(('(not (' + operator), '')[:-2].split()
-        else:
-            instatiated_pred_args = effect.replace('(' + operator, '')[:-1].split() 
+        negated, operator, instatiated_pred_args = split_atom(parse_atom(new_effects[i]))
 
         static_pred_args, new_args = parse_and_map_predicate_args(instatiated_pred_args, args, pddl_args)
-        pred = StaticPredicate(operator, static_pred_args) if 'not' not in effect else StaticPredicate('not', [StaticPredicate(operator, static_pred_args)])
+        pred = StaticPredicate(operator, static_pred_args) if not negated else StaticPredicate('not', [StaticPredicate(operator, static_pred_args)])
 
         new_action.addEffect(pred)
         for new_arg in new_args:
@@ -5,6 +5,7 @@ import rospy
 from std_msgs.msg import Empty
 
 from pddl.srv import *
+from util.world_state import ATOMS, describe_changes, effects_met, negate, parse_atom, split_atom
 
 pddlInstatiations = rospy.ServiceProxy('get_pddl_instatiations_srv', GetActionPDDLBindingSrv)
 
@@ -24,11 +25,35 @@ def check_pddl_effects(req):
 
     return (CONDITION_loc and CONDITION_nonLoc) == True
 
+# Same check as above, but run on the change set of a single step. Location 
+# changes only ever show up in the deltas, so only the positive non-loc effects
+# that held before the step need the preconditions. 
+def check_pddl_effect_deltas(req):
+    actionName = req.actionName
+    args = req.args
+    expectatation = pddlInstatiations(actionName, args).pddlBindings
+    exp_pre = expectatation.preconditions
+    exp_effects = expectatation.effects
+
+    changes = generate_delta_effects(req.added, req.removed)
+    locChanging_actual = detect_loc_changing_objects(changes)
+    locChanging_expected = detect_loc_changing_objects(exp_effects)
+    if locChanging_expected == []:
+        locChanging_expected = detect_loc_changing_objects(exp_effects + exp_pre)
+    CONDITION_loc = all(x in locChanging_actual for x in locChanging_expected)
+
+    pre = ATOMS.mask(req.preconditions)
+    added = ATOMS.mask(req.added)
+    removed = ATOMS.mask(req.removed)
+    CONDITION_nonLoc = effects_met(pre, added, removed, exp_effects, include_loc=False)
+
+    return (CONDITION_loc and CONDITION_nonLoc) == True
+
 def extract_relevant_effects(preds, args, sole_arg=True):
     relevant = []
 
     for p in preds:
-        vals = p[6:-2].split()[1:] if '(not ' in p else p[:-1].split()[1:]
+        _, _, vals = split_atom(parse_atom(p))
 
         vals = [x for x in vals if 'gripper' not in x]
         args = [x for x in args if 'gripper' not in x]
@@ -51,17 +76,16 @@ def novel_effect(req):
     actual_effects = req.effects
     expectatation = pddlInstatiations(actionName, args).pddlBindings.effects
 
-    effects_met = check_pddl_effects(req)
+    orig_effects_met = check_pddl_effects(req)
 
     ## Non Loc
-    w_negation = generate_effects_negations(actual_pre, actual_effects)
-    effects = [x for x in w_negation if 'at' not in x]
-    expected_effects = [x for x in expectatation if 'at' not in x] 
-    new_effects = [x for x in effects if x not in actual_pre]
+    pre = ATOMS.mask(actual_pre)
+    eff = ATOMS.mask(actual_effects)
+    new_effects = describe_changes(eff & ~pre, pre & ~eff, include_loc=False)
     relevant_novel_effects = extract_relevant_effects(new_effects, args)
 
     is_novel = (relevant_novel_effects != [])
-    same_effects_as_orig = effects_met
+    same_effects_as_orig = orig_effects_met
     new_effects = relevant_novel_effects
 
     # print('------------------------------------------------------')
@@ -91,36 +115,35 @@ def loc_effects_met(pre, eff, exp_pre, exp_eff):
     return False
 
 def nonLoc_effects_met(pre, eff, exp_pre, exp_eff): 
-    w_negation = generate_effects_negations(pre, eff)
-
-    effects = [x for x in w_negation if 'at' not in x]
-    expected_effects = [x for x in exp_eff if 'at' not in x] 
-    
-    if all(x in effects for x in expected_effects):
-        return True
-    return False  
+    pre = ATOMS.mask(pre)
+    eff = ATOMS.mask(eff)
+    return effects_met(pre, eff & ~pre, pre & ~eff, exp_eff, include_loc=False)
 
 # This assumes that there is a negation of its original, and that there is a new
 # Loc, which might not always be the case in the case of the KB representation.. 
 
 def detect_loc_changing_objects(predicates):
-    effects = [x for x in predicates if 'at' in x]
-    negativeLoc_objs = [x[9:].split()[0] for x in effects if '(not ' in x]
-    positiveLoc_objs = [x[4:].split()[0] for x in effects if '(not ' not in x]
+    effects = [split_atom(parse_atom(x)) for x in predicates]
+    effects = [x for x in effects if x[1] == 'at']
+    negativeLoc_objs = [args[0] for negated, _, args in effects if negated]
+    positiveLoc_objs = [args[0] for negated, _, args in effects if not negated]
     loc_changing_objects = [x for x in positiveLoc_objs if x in negativeLoc_objs]
     return loc_changing_objects 
 
 def generate_effects_negations(preconditions, effects):
-    for pre in preconditions:
-        if pre not in effects:
-            effects.append('(not ' + pre + ')')
-    return list(set(effects))
+    pre = ATOMS.mask(preconditions)
+    eff = ATOMS.mask(effects)
+    return ATOMS.to_atoms(eff) + negate(ATOMS.to_atoms(pre & ~eff))
+
+def generate_delta_effects(added, removed):
+    return list(added) + negate(removed)
 
 ###########################################################################
 def main():
     rospy.init_node("pddl_checker_node")
 
     rospy.Service("check_effects_srv", CheckEffectsSrv, check_pddl_effects)
+    rospy.Service("check_effect_deltas_srv", CheckEffectDeltasSrv, check_pddl_effect_deltas)
     rospy.Service("novel_effect_srv", NovelEffectsSrv, novel_effect)
     # rospy.Service("loosely_novel_effect_srv", NovelEffectsSrv, loosely_novel_effect)
 
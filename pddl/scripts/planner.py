@@ -2,6 +2,7 @@
 
 import sys
 import os 
+import time
 import rospy
 from threading import Thread
 
@@ -9,7 +10,8 @@ from std_msgs.msg import Empty
 
 
 from util.file_io import * 
-from util.data_conversion import getPlanFromPDDLactionList 
+from util.data_conversion import getPlanFromPDDLactionList, applyStateDiff
+from util.predicate_stream import SETTLE_POLL, SETTLE_TIMEOUT
 from util.pddl_parser.planner import Planner 
 from agent.srv import * 
 from pddl.msg import *
@@ -20,8 +22,8 @@ from environment.srv import *
 KBDomainProxy = rospy.ServiceProxy('get_KB_domain_srv', GetKBDomainSrv)
 KBActionLocsProxy = rospy.ServiceProxy('get_KB_action_locs', GetKBActionLocsSrv)
 pddlActionExecutorProxy = rospy.ServiceProxy('pddl_action_executor_srv', PddlExecutorSrv)
-scenarioData = rospy.ServiceProxy('scenario_data_srv', ScenarioDataSrv)
-checkPddlEffects = rospy.ServiceProxy('check_effects_srv', CheckEffectsSrv)
+scenarioDataDiff = rospy.ServiceProxy('scenario_data_diff_srv', ScenarioDataDiffSrv)
+checkPddlEffectDeltas = rospy.ServiceProxy('check_effect_deltas_srv', CheckEffectDeltasSrv)
 
 def solve_plan(solution, domainFilepath, problemFilepath):
     planner = Planner()
@@ -89,32 +91,54 @@ def generate_plan(req):
     
     return PlanGeneratorSrvResponse(ActionExecutionInfoList(actionList))
 
+# Diff since the given version, once scenario_data's state accounts for every 
+# world tick up to stamp (its updates are rate limited), as in 
+# PredicateStream.settled. Gives the latest diff after SETTLE_TIMEOUT. 
+def settledDiff(since_version, stamp):
+    deadline = rospy.get_time() + SETTLE_TIMEOUT
+    diff = scenarioDataDiff(since_version)
+    while (diff.source_stamp < stamp) and (rospy.get_time() < deadline):
+        time.sleep(SETTLE_POLL)
+        diff = scenarioDataDiff(since_version)
+    if diff.source_stamp < stamp:
+        rospy.logwarn("Predicate state still behind the action's end after {0}s".format(SETTLE_TIMEOUT))
+    return diff
+
 def execute_plan(req):
     execution_success = False
     goal_complete = None
     failure_action = None
 
     trial_start = rospy.get_time()
+    start_stamp = rospy.Time.now()
+
+    # Hold the init state locally and only pull the deltas after each step
+    snapshot = scenarioDataDiff(-1)
+    state_version = snapshot.version
+    state, _, _ = applyStateDiff(set(), snapshot)
+
     for action in req.actions.actions:
         actionName = action.actionName
         args = action.argVals 
 
-        preconditions = scenarioData().init
+        preconditions = list(state)
 
         try:
             action_success = pddlActionExecutorProxy(actionName, args)
         except:
             failure_action = actionName
             trial_end = rospy.get_time()
-            return PlanExecutionOutcome(execution_success, goal_complete, failure_action, trial_end - trial_start)
+            return PlanExecutionOutcome(execution_success, goal_complete, failure_action, trial_end - trial_start, start_stamp, rospy.Time.now())
 
         if action_success == 0:
             failure_action = actionName
             trial_end = rospy.get_time()
-            return PlanExecutionOutcome(execution_success, goal_complete, failure_action, trial_end - trial_start)
+            return PlanExecutionOutcome(execution_success, goal_complete, failure_action, trial_end - trial_start, start_stamp, rospy.Time.now())
 
-        effects = scenarioData().init
-        effects_met = checkPddlEffects(actionName, args, preconditions, effects).effects_met
+        diff = settledDiff(state_version, rospy.Time.now())
+        state_version = diff.version
+        state, added, removed = applyStateDiff(state, diff)
+        effects_met = checkPddlEffectDeltas(actionName, args, preconditions, added, removed).effects_met
 
         if effects_met == False:
             failure_action = actionName
@@ -122,7 +146,7 @@ def execute_plan(req):
 
     trial_end = rospy.get_time()
     execution_success = True
-    return PlanExecutionOutcome(execution_success, goal_complete, failure_action, trial_end - trial_start)  
+    return PlanExecutionOutcome(execution_success, goal_complete, failure_action, trial_end - trial_start, start_stamp, rospy.Time.now())  
 
 ###########################################################################
 def main():
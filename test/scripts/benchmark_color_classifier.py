@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# Per-frame cost of ImageConverter's color classification: the per-channel
+# lookup tables and bincount in util.image_converter against the original
+# per-color inRange masks and segmentations, on synthetic head camera frames (a
+# noisy table top with colored blobs). Also checks that both count the same
+# pixels.
+#
+#   rosrun test benchmark_color_classifier.py
+
+import timeit
+import cv2
+import numpy as np
+
+from util.image_converter import *
+
+FRAME_SIZE = (800, 800)
+FRAMES = 5
+REPEATS = 5
+
+def make_frame(seed):
+    rand = np.random.RandomState(seed)
+    table = np.array([60, 90, 120])
+    frame = np.clip(table + rand.normal(0, 12, FRAME_SIZE + (3,)), 0, 255).astype(np.uint8)
+    for color in [(255, 0, 0), (0, 255, 0), (0, 0, 0), (255, 255, 255)]:
+        for _ in range(3):
+            x, y = rand.randint(0, FRAME_SIZE[1] - 80), rand.randint(0, FRAME_SIZE[0] - 80)
+            frame[y:y+rand.randint(10, 80), x:x+rand.randint(10, 80)] = color
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+def count_segmented_areas(mask):
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
+    opening = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+    counts = cv2.findContours(opening, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    counts = counts[0] if len(counts) == 2 else counts[1]
+    return len(counts)
+
+# The original color_count_pixels: one inRange (and, but for green, one 
+# segmentation) per color, bounds recomputed from 1x1 images every frame
+def baseline_counts(hsv_image):
+    counts = {}
+    for color in COLOR_LABELS:
+        if color == 'black':
+            lower, upper = COLOR_BOUNDS['black']
+        elif color == 'white':
+            lower, upper = COLOR_BOUNDS['white']
+        else:
+            bgr = {'blue' : [255, 0, 0], 'green' : [0, 255, 0], 'red' : [0, 0, 255], 'orange' : [0, 165, 255]}[color]
+            hsv = cv2.cvtColor(np.uint8([[bgr]]), cv2.COLOR_BGR2HSV)
+            lower = np.array([hsv[0][0][0] - HUE_RANGE, 100, 100], dtype=np.uint8)
+            upper = np.array([hsv[0][0][0] + HUE_RANGE, 255, 255], dtype=np.uint8)
+        mask = cv2.inRange(hsv_image, lower, upper)
+        counts[color] = np.count_nonzero(mask)
+        if color != 'green':
+            count_segmented_areas(mask)
+    return counts
+
+def lut_counts(hsv_image):
+    return color_counts(classify_hsv(hsv_image))
+
+def main():
+    frames = [make_frame(seed) for seed in range(FRAMES)]
+    for frame in frames:
+        assert baseline_counts(frame) == lut_counts(frame)
+
+    for label, f in [('inRange', baseline_counts), ('lookup table', lut_counts)]:
+        t = min(timeit.repeat(lambda: [f(frame) for frame in frames], number=1, repeat=REPEATS)) / FRAMES
+        print('{0:>14}: {1:.2f} ms/frame'.format(label, t * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+# Benchmark of contact evaluation cost against scene size, with and without the
+# uniform grid index in util.spatial_relations. Each tick moves every object a
+# little (as the world state would), feeds the poses through set_position and
+# runs ContactTable.evaluate, as scenario_data does on every update. Each
+# object is tabled against PAIRS_PER_OBJECT others.
+#
+#   rosrun test benchmark_contact_index.py
+
+import timeit
+import numpy as np
+
+from util.spatial_relations import ContactTable
+
+SIZES = [10, 20, 50, 100, 200, 1000]
+PAIRS_PER_OBJECT = 4
+TABLE_SIZE = (2.0, 1.0) # m, synthetic tabletop
+XY_EPSILON = 0.1
+Z_EPSILON = 0.1
+CELL_SIZE = 0.1
+TICKS = 20
+
+def make_scene(n, cell_size, seed=0):
+    rand = np.random.RandomState(seed)
+    names = ['obj' + str(i) for i in range(n)]
+    touching = [(names[i], names[j], XY_EPSILON, Z_EPSILON)
+                for i in range(n) for j in rand.choice(n, PAIRS_PER_OBJECT, replace=False) if j != i]
+    table = ContactTable(names, touching, [], cell_size)
+    start = np.column_stack([rand.uniform(0, TABLE_SIZE[0], n),
+                             rand.uniform(0, TABLE_SIZE[1], n),
+                             rand.uniform(0, 0.2, n)])
+    for i in range(n):
+        table.set_position(names[i], start[i])
+    return table, start, rand
+
+def tick(table, start, rand):
+    moved = start + rand.normal(0, 0.01, start.shape)
+    for i in range(len(table.names)):
+        table.set_position(table.names[i], moved[i])
+    touching, _ = table.evaluate()
+    return touching
+
+def time_ticks(table, start, rand):
+    return min(timeit.repeat(lambda: tick(table, start, rand), number=1, repeat=TICKS))
+
+def main():
+    print('{0:>8} {1:>8} {2:>12} {3:>12} {4:>8}'.format('objects', 'pairs', 'dense (ms)', 'grid (ms)', 'touching'))
+    for n in SIZES:
+        dense = make_scene(n, None)
+        grid = make_scene(n, CELL_SIZE)
+        touching = tick(*make_scene(n, None))
+        assert (touching == tick(*make_scene(n, CELL_SIZE))).all()
+        dense_ms = time_ticks(*dense) * 1000.0
+        grid_ms = time_ticks(*grid) * 1000.0
+        print('{0:>8} {1:>8} {2:12.3f} {3:12.3f} {4:>8}'.format(n, len(touching), dense_ms, grid_ms, np.count_nonzero(touching)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Microbenchmark for the predicate list utilities in util.data_conversion.
+# Compares the set-based versions against the original string-list scans.
+#
+#   rosrun test benchmark_predicate_diffs.py
+
+import random
+import timeit
+
+from geometry_msgs.msg import PoseStamped
+from environment.msg import Predicate
+
+from util.data_conversion import *
+
+SIZES = [10, 100, 1000, 10000]
+MAX_BASELINE_SIZE = 1000 # the O(n^2) scans take minutes past this
+REPEATS = 3
+
+def make_predicates(n, seed):
+    rand = random.Random(seed)
+    preds = []
+    for i in range(n):
+        if i % 4 == 0:
+            loc = PoseStamped()
+            loc.pose.position.x = rand.randint(0, 9) / 10.0
+            loc.pose.position.y = rand.randint(0, 9) / 10.0
+            loc.pose.position.z = float(i)
+            preds.append(Predicate(operator='at', objects=['obj' + str(i)], locationInformation=loc))
+        else:
+            preds.append(Predicate(operator='touching', objects=['obj' + str(i), 'obj' + str(rand.randint(0, n))]))
+    return preds
+
+#### Original implementations, kept for comparison
+def baseline_getPredicateDiffs(predList1, predList2):
+    diffs = []
+    p1 = pddlInitStringFormat(predList1)
+    p2 = pddlInitStringFormat(predList2)
+    for i in range(len(p1)):
+        if p1[i] not in p2:
+            diffs.append(predList1[i])
+    for i in range(len(p2)):
+        if p2[i] not in p1:
+            diffs.append(predList2[i])
+    return diffs
+
+def baseline_getPredicateCommonElements(predList1, predList2):
+    common = []
+    commonStr = []
+    p1 = pddlInitStringFormat(predList1)
+    p2 = pddlInitStringFormat(predList2)
+    for i in range(len(p1)):
+        if p1[i] in p2:
+            if p1[i] not in commonStr:
+                commonStr.append(p1[i])
+                common.append(predList1[i])
+    for i in range(len(p2)):
+        if p2[i] in p1:
+            if p2[i] not in commonStr:
+                commonStr.append(p2[i])
+                common.append(predList2[i])
+    return common
+
+def baseline_removePredicateList(listToRemoveFrom, listToRemove):
+    newList = []
+    p1 = pddlInitStringFormat(listToRemoveFrom)
+    p2 = pddlInitStringFormat(listToRemove)
+    for i in range(len(p1)):
+        if p1[i] not in p2:
+            newList.append(listToRemoveFrom[i])
+    return list(set(newList))
+
+CASES = [('getPredicateDiffs', getPredicateDiffs, baseline_getPredicateDiffs),
+         ('getPredicateCommonElements', getPredicateCommonElements, baseline_getPredicateCommonElements),
+         ('removePredicateList', removePredicateList, baseline_removePredicateList)]
+
+def best_time(fn, a, b):
+    return min(timeit.repeat(lambda: fn(a, b), number=1, repeat=REPEATS))
+
+def main():
+    print('{0:<28} {1:>6} {2:>12} {3:>12}'.format('function', 'atoms', 'sets (ms)', 'lists (ms)'))
+    for n in SIZES:
+        # Half of the second list overlaps with the first
+        a = make_predicates(n, 0)
+        b = a[:n // 2] + make_predicates(n - n // 2, 1)
+        for name, fn, baseline in CASES:
+            if n <= MAX_BASELINE_SIZE:
+                assert sorted(predicateKeys(fn(a, b))) == sorted(predicateKeys(baseline(a, b)))
+            new_ms = best_time(fn, a, b) * 1000.0
+            if n <= MAX_BASELINE_SIZE:
+                old_ms = '{0:12.2f}'.format(best_time(baseline, a, b) * 1000.0)
+            else:
+                old_ms = '{0:>12}'.format('-')
+            print('{0:<28} {1:>6} {2:12.2f} {3}'.format(name, n, new_ms, old_ms))
+
+if __name__ == "__main__":
+    main()
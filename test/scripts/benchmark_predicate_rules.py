@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# Per-tick cost of scenario_data's physical predicates: the contact table and
+# rule set (util.scenario_objects.physical_state_rules) against the original
+# hand-written if-chains. Also checks that both publish the same predicates in
+# the same order over episodes of sampled poses, button latches and the
+# require_burner_on flag included.
+#
+#   rosrun test benchmark_predicate_rules.py
+
+import timeit
+import numpy as np
+
+from geometry_msgs.msg import PoseStamped
+
+from util.data_conversion import is_touching, is_pressed
+from util.predicate_rules import RuleEngine
+from util.scenario_objects import *
+from util.spatial_relations import ContactTable
+
+EPISODES = 200
+TICKS = 20      # per episode; latches are released between episodes
+SPREAD = 0.05   # m, around a shared centre, so that contacts are frequent
+REPEATS = 5
+
+def make_episode(rand):
+    names = list(OBJECTS)
+    centre = rand.uniform(-0.5, 0.5, 3)
+    ticks = []
+    for _ in range(TICKS):
+        positions = centre + rand.normal(0, SPREAD, (len(names), 3))
+        missing = rand.uniform(size=len(names)) < 0.05 # objects without a pose yet
+        ticks.append(dict((name, None if missing[k] else positions[k]) for k, name in enumerate(names)))
+    return rand.uniform() < 0.5, ticks
+
+def pose_stamped(position):
+    if position is None:
+        return None
+    pose = PoseStamped()
+    pose.pose.position.x, pose.pose.position.y, pose.pose.position.z = position
+    return pose
+
+#### Original implementation, kept for comparison
+class BaselinePredicates(object):
+    def __init__(self, require_burner_on):
+        self.require_burner_on = require_burner_on
+        self.left_button_pressed = False
+        self.right_button_pressed = False
+
+    def update(self, poses):
+        LeftGripperPose, RightGripperPose = poses['left_gripper'], poses['right_gripper']
+        TablePose, CupPose, CoverPose = poses['table'], poses['cup'], poses['cover']
+        BurnerPose, LeftButtonPose, RightButtonPose = poses['burner1'], poses['left_button'], poses['right_button']
+        preds = []
+
+        if is_touching(LeftGripperPose, TablePose, 1.0, 0.1):
+            preds.append(('touching', 'left_gripper', 'table'))
+        if is_touching(RightGripperPose, TablePose, 1.0, 0.1):
+            preds.append(('touching', 'right_gripper', 'table'))
+        if is_touching(CupPose, TablePose, 1.0, 0.1):
+            preds.append(('touching', 'cup', 'table'))
+        if is_touching(CoverPose, TablePose, 1.0, 0.1):
+            preds.append(('touching', 'cover', 'table'))
+        if is_touching(CoverPose, CupPose, 0.1):
+            preds.append(('touching', 'cover', 'cup'))
+        if is_touching(LeftGripperPose, CoverPose, 0.1):
+            preds.append(('touching', 'left_gripper', 'cover'))
+        if is_touching(RightGripperPose, CoverPose, 0.1):
+            preds.append(('touching', 'right_gripper', 'cover'))
+
+        if is_pressed(LeftGripperPose, LeftButtonPose, 0.08, [0.07, None]):
+            self.left_button_pressed = True
+        if is_pressed(RightGripperPose, LeftButtonPose, 0.08, [0.07, None]):
+            self.left_button_pressed = True
+        if is_pressed(LeftGripperPose, RightButtonPose, 0.08, [0.07, None]):
+            self.right_button_pressed = True
+        if is_pressed(RightGripperPose, RightButtonPose, 0.08, [0.07, None]):
+            self.right_button_pressed = True
+
+        item_on_burner = []
+        covered_item = []
+        burner_on = False
+
+        if is_touching(CoverPose, BurnerPose, 0.1, 0.06):
+            preds.append(('touching', 'cover', 'burner1'))
+            preds.append(('on_burner', 'cover', 'burner1'))
+            item_on_burner.append('cover')
+        if is_touching(CupPose, BurnerPose, 0.1, 0.06):
+            preds.append(('touching', 'cup', 'burner1'))
+            preds.append(('on_burner', 'cup', 'burner1'))
+            item_on_burner.append('cup')
+
+        if is_pressed(CupPose, CoverPose, 0.1, [0.07, None]):
+            preds.append(('covered', 'cover'))
+            covered_item.append('cover')
+        if is_pressed(CoverPose, CupPose, 0.1, [0.07, None]):
+            preds.append(('covered', 'cup'))
+            covered_item.append('cup')
+
+        if self.right_button_pressed == True:
+            preds.append(('pressed', 'left_button'))
+            preds.append(('powered_on', 'burner1'))
+            burner_on = True
+        if self.right_button_pressed == True:
+            preds.append(('pressed', 'right_button'))
+
+        for item in item_on_burner:
+            if item in covered_item:
+                if self.require_burner_on == False:
+                    preds.append(('cooking', item))
+                elif burner_on == True:
+                    preds.append(('cooking', item))
+        return preds
+
+# As scenario_data's updatePhysicalStateBasedPredicates
+class RulePredicates(object):
+    def __init__(self, require_burner_on):
+        self.table = ContactTable(list(OBJECTS), TOUCHING_PAIRS, PRESSING_PAIRS)
+        self.contact_facts = [('contact',) + pair for pair in self.table.touching_pairs]
+        self.press_facts = [('press',) + pair for pair in self.table.pressing_pairs]
+        self.engine = RuleEngine(physical_state_rules(self.table.touching_pairs))
+        self.engine.set_input(('require_burner_on',), require_burner_on)
+
+    def update(self, positions):
+        for name, position in positions.items():
+            if position is None:
+                self.table.remove_position(name)
+            else:
+                self.table.set_position(name, position)
+        touching, pressed = self.table.evaluate()
+        self.engine.set_mask('contact', self.contact_facts, touching)
+        self.engine.set_mask('press', self.press_facts, pressed)
+        self.engine.update()
+        return self.engine.true_facts()
+
+def run_baseline(episodes):
+    for require_burner_on, ticks in episodes:
+        predicates = BaselinePredicates(require_burner_on)
+        for poses in ticks:
+            predicates.update(poses)
+
+def run_rules(episodes):
+    for require_burner_on, ticks in episodes:
+        predicates = RulePredicates(require_burner_on)
+        for positions in ticks:
+            predicates.update(positions)
+
+def main():
+    rand = np.random.RandomState(0)
+    episodes = [make_episode(rand) for _ in range(EPISODES)]
+    baseline_episodes = [(required, [dict((name, pose_stamped(p)) for name, p in positions.items()) for positions in ticks])
+                         for required, ticks in episodes]
+
+    seen = set()
+    for (required, ticks), (_, poses) in zip(episodes, baseline_episodes):
+        baseline, rules = BaselinePredicates(required), RulePredicates(required)
+        for k in range(TICKS):
+            expected = baseline.update(poses[k])
+            assert rules.update(ticks[k]) == expected, (expected, rules.engine.true_facts())
+            seen.update(expected)
+    print('{0} ticks agree; {1} distinct predicates seen'.format(EPISODES * TICKS, len(seen)))
+
+    ticks = float(EPISODES * TICKS)
+    baseline_ms = min(timeit.repeat(lambda: run_baseline(baseline_episodes), number=1, repeat=REPEATS)) * 1000.0 / ticks
+    rules_ms = min(timeit.repeat(lambda: run_rules(episodes), number=1, repeat=REPEATS)) * 1000.0 / ticks
+    print('{0:>16} {1:>16}'.format('if-chains (ms)', 'rules (ms)'))
+    print('{0:16.4f} {1:16.4f}'.format(baseline_ms, rules_ms))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+# Latency / accuracy trade-off of cropping and downscaling head camera frames
+# before color classification (util.image_converter.reduce_frame). Each mode is
+# compared against classifying the full frame: how often the cup (blue) and
+# cover (green) visibility answers agree, and the mean relative error of their
+# pixel counts.
+#
+#   rosrun test benchmark_vision_roi.py [frames_dir] [--roi x y w h]
+#
+# frames_dir holds frames recorded from /cameras/head_camera/image (png/jpg),
+# e.g. saved with image_view's extract_images; --roi is the vision node's
+# table ROI for them (logged at startup). Without frames, synthetic ones are
+# used: a table top with cup and cover blobs of varying size.
+
+import os
+import sys
+import argparse
+import timeit
+import cv2
+import numpy as np
+
+from util.image_converter import reduce_frame, classify_hsv, color_counts
+
+FRAME_SIZE = (800, 1280)
+SYNTHETIC_ROI = (340, 260, 600, 420)
+SYNTHETIC_FRAMES = 20
+DOWNSCALES = [0, 1, 2]
+REPEATS = 3
+
+def synthetic_frames(n, seed=0):
+    rand = np.random.RandomState(seed)
+    frames = []
+    x, y, w, h = SYNTHETIC_ROI
+    for _ in range(n):
+        frame = np.clip(np.array([40, 40, 40]) + rand.normal(0, 10, FRAME_SIZE + (3,)), 0, 255).astype(np.uint8)
+        frame[y:y+h, x:x+w] = np.clip(np.array([60, 90, 120]) + rand.normal(0, 10, (h, w, 3)), 0, 255).astype(np.uint8)
+        for color in [(255, 0, 0), (0, 255, 0)]:
+            if rand.rand() < 0.8:
+                size = rand.randint(2, 60)
+                bx, by = x + rand.randint(0, w - size), y + rand.randint(0, h - size)
+                cv2.circle(frame, (bx + size // 2, by + size // 2), size // 2, color, -1)
+        frames.append(frame)
+    return frames
+
+def recorded_frames(path):
+    names = sorted(n for n in os.listdir(path) if n.lower().endswith(('.png', '.jpg', '.jpeg')))
+    return [cv2.imread(os.path.join(path, n)) for n in names]
+
+def counts(frame, roi, downscale):
+    reduced = reduce_frame(frame, roi, downscale)
+    c = color_counts(classify_hsv(cv2.cvtColor(reduced, cv2.COLOR_BGR2HSV)))
+    scale = 4 ** downscale
+    return c['blue'] * scale, c['green'] * scale
+
+def relative_error(count, reference):
+    return abs(count - reference) / float(max(reference, 1))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('frames_dir', nargs='?')
+    parser.add_argument('--roi', nargs=4, type=int)
+    args = parser.parse_args()
+
+    if args.frames_dir is not None:
+        frames = recorded_frames(args.frames_dir)
+        roi = tuple(args.roi) if args.roi is not None else None
+    else:
+        frames = synthetic_frames(SYNTHETIC_FRAMES)
+        roi = SYNTHETIC_ROI
+    if len(frames) == 0:
+        print('No frames found')
+        return 1
+    print('{0} frames of {1}x{2}, roi {3}'.format(len(frames), frames[0].shape[1], frames[0].shape[0], roi))
+
+    reference = [counts(frame, None, 0) for frame in frames]
+    modes = [('full', None, d) for d in DOWNSCALES]
+    if roi is not None:
+        modes += [('roi', roi, d) for d in DOWNSCALES]
+    print('{0:>6} {1:>9} {2:>10} {3:>10} {4:>10}'.format('mode', 'downscale', 'ms/frame', 'agreement', 'count err'))
+    for label, mode_roi, downscale in modes:
+        t = min(timeit.repeat(lambda: [counts(f, mode_roi, downscale) for f in frames], number=1, repeat=REPEATS))
+        agree = 0
+        errors = []
+        for frame, ref in zip(frames, reference):
+            result = counts(frame, mode_roi, downscale)
+            agree += sum((r > 0) == (c > 0) for r, c in zip(ref, result))
+            errors += [relative_error(c, r) for r, c in zip(ref, result) if r > 0]
+        print('{0:>6} {1:>9} {2:>10.2f} {3:>9.1f}% {4:>9.1f}%'.format(
+              label, downscale, t * 1000 / len(frames), 100.0 * agree / (2 * len(frames)),
+              100.0 * np.mean(errors) if errors else 0.0))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -197,18 +197,38 @@ def pddlCondsKBFormat(_vars, args, predicates_list, mode):
 
     return predList
 
+# Hashable identity of a predicate; two predicates share a key iff they 
+# format to the same pddl init string 
+def predicateKey(pred):
+    if pred.operator == "at":
+        return (pred.operator, str(pred.objects[0]), poseStampedToString(pred.locationInformation))
+    return (pred.operator,) + tuple(pred.objects)
+
+def predicateKeys(predList):
+    return [predicateKey(pred) for pred in predList]
+
 def getPredicateDiffs(predList1, predList2):
-    diffs = []
-    p1 = pddlInitStringFormat(predList1)
-    p2 = pddlInitStringFormat(predList2)
-    for i in range(len(p1)):
-        if p1[i] not in p2:
-            diffs.append(predList1[i])
-    for i in range(len(p2)):
-        if p2[i] not in p1:
-            diffs.append(predList2[i])
+    k1 = predicateKeys(predList1)
+    k2 = predicateKeys(predList2)
+    s1 = set(k1)
+    s2 = set(k2)
+    diffs = [predList1[i] for i in range(len(k1)) if k1[i] not in s2]
+    diffs.extend([predList2[i] for i in range(len(k2)) if k2[i] not in s1])
     return diffs
 
+# Applies a scenario_data_diff_srv response to a locally held set of init strings.
+# Returns the new state along with the atoms that were added and removed.
+def applyStateDiff(state, diff):
+    if diff.full_state == True:
+        new_state = set(diff.added)
+        added = [x for x in new_state if x not in state]
+        removed = [x for x in state if x not in new_state]
+    else:
+        added = list(diff.added)
+        removed = list(diff.removed)
+        new_state = state.difference(removed).union(added)
+    return new_state, added, removed
+
 def removeLocPredicates(predList):
     newList = []
     for pred in predList:
@@ -224,31 +244,43 @@ def removeNonArgPredicates(predList, args):
     return newList
 
 def getPredicateCommonElements(predList1, predList2):
+    k1 = predicateKeys(predList1)
+    k2 = predicateKeys(predList2)
+    shared = set(k1).intersection(k2)
     common = []
-    commonStr = []
-    p1 = pddlInitStringFormat(predList1)
-    p2 = pddlInitStringFormat(predList2)
-    for i in range(len(p1)):
-        if p1[i] in p2:
-            if p1[i] not in commonStr:
-                commonStr.append(p1[i])
-                common.append(predList1[i])
-    for i in range(len(p2)):
-        if p2[i] in p1:
-            if p2[i] not in commonStr:
-                commonStr.append(p2[i])
-                common.append(predList2[i])
+    seen = set()
+    for keys, predList in [(k1, predList1), (k2, predList2)]:
+        for i in range(len(keys)):
+            if (keys[i] in shared) and (keys[i] not in seen):
+                seen.add(keys[i])
+                common.append(predList[i])
     return common
 
 def removePredicateList(listToRemoveFrom, listToRemove):
-    newList = []
-    p1 = pddlInitStringFormat(listToRemoveFrom)
-    p2 = pddlInitStringFormat(listToRemove)
-    for i in range(len(p1)):
-        if p1[i] not in p2:
-            newList.append(listToRemoveFrom[i])
+    k1 = predicateKeys(listToRemoveFrom)
+    s2 = set(predicateKeys(listToRemove))
+    newList = [listToRemoveFrom[i] for i in range(len(k1)) if k1[i] not in s2]
     return list(set(newList))
 
+# [(name, Pose)] -> (names, positions, orientations) packed as in environment/WorldState
+def worldStateArrays(poses):
+    names = []
+    positions = []
+    orientations = []
+    for name, pose in poses:
+        names.append(name)
+        positions.extend([pose.position.x, pose.position.y, pose.position.z])
+        orientations.extend([pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w])
+    return names, positions, orientations
+
+# environment/WorldState -> [(name, Pose)]
+def worldStatePoses(worldState):
+    p = worldState.positions
+    q = worldState.orientations
+    return [(name, Pose(position=Point(p[3*i], p[3*i+1], p[3*i+2]),
+                        orientation=Quaternion(q[4*i], q[4*i+1], q[4*i+2], q[4*i+3])))
+            for i, name in enumerate(worldState.names)]
+
 def poseStampedToString(val):
     x = round(val.pose.position.x, 1)
     y = round(val.pose.position.y, 1)
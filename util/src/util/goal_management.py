@@ -6,20 +6,10 @@ import numpy as np
 from datetime import datetime
 import csv
 import copy 
+from util.world_state import ATOMS, compile_conditions, holds
 
 def goalAccomplished(goalList, currentState):
-    numGoalsAccomplished = 0
-    for goal in goalList:
-
-        if goal in currentState:
-            numGoalsAccomplished = numGoalsAccomplished + 1
-        elif 'not' in goal:
-            goal = goal[5:-1] # strip out the not operation (should abstract this)
-            if goal not in currentState:
-                numGoalsAccomplished = numGoalsAccomplished + 1
-    if numGoalsAccomplished == len(goalList):
-        return True
-    return False
+    return holds(ATOMS.mask(currentState), compile_conditions(goalList))
 
     
 def generateExperimentDir(experimentRunDirectory, expName):
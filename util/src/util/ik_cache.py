@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import math
+from collections import OrderedDict
+
+# LRU cache of IK joint solutions, keyed by limb, frame and pose quantized to
+# POSITION_STEP (m) / ORIENTATION_STEP (quaternion components). Entries also
+# keep the pose they were solved for, so that a miss can be seeded with the
+# solution of the nearest cached pose.
+IK_CACHE_SIZE = 512
+POSITION_STEP = 0.001
+ORIENTATION_STEP = 0.001
+ORIENTATION_WEIGHT = 1.0 # m per unit of 1 - |q.q'|, for nearest()
+
+def quaternion_tuple(q):
+    # q and -q are the same rotation: make the largest-magnitude component 
+    # positive (not w, which is ~0 for the gripper-down orientation) 
+    components = (q.x, q.y, q.z, q.w)
+    sign = -1.0 if max(components, key=abs) < 0 else 1.0
+    return tuple(sign * v for v in components)
+
+class IKCache(object):
+    def __init__(self, capacity=IK_CACHE_SIZE, position_step=POSITION_STEP, orientation_step=ORIENTATION_STEP):
+        self.capacity = capacity
+        self.position_step = position_step
+        self.orientation_step = orientation_step
+        self._entries = OrderedDict() # key -> (limb, position, orientation, joints)
+
+    def key(self, limb, pose_stamped):
+        p = pose_stamped.pose.position
+        q = quaternion_tuple(pose_stamped.pose.orientation)
+        return ((limb, pose_stamped.header.frame_id) +
+                tuple(int(round(v / self.position_step)) for v in (p.x, p.y, p.z)) +
+                tuple(int(round(v / self.orientation_step)) for v in q))
+
+    # Joint solution for the pose, or None
+    def get(self, limb, pose_stamped):
+        key = self.key(limb, pose_stamped)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._entries[key] = entry
+        return entry[3]
+
+    def put(self, limb, pose_stamped, joints):
+        key = self.key(limb, pose_stamped)
+        p = pose_stamped.pose.position
+        self._entries.pop(key, None)
+        self._entries[key] = (limb, (p.x, p.y, p.z), quaternion_tuple(pose_stamped.pose.orientation), joints)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    # Joint solution of the cached pose of the limb closest to the given one
+    def nearest(self, limb, pose_stamped):
+        p = pose_stamped.pose.position
+        q = quaternion_tuple(pose_stamped.pose.orientation)
+        best, best_distance = None, None
+        for entry_limb, position, orientation, joints in self._entries.values():
+            if entry_limb != limb:
+                continue
+            distance = (math.sqrt(sum((a - b)**2 for a, b in zip((p.x, p.y, p.z), position))) +
+                        ORIENTATION_WEIGHT * (1.0 - abs(sum(a * b for a, b in zip(q, orientation)))))
+            if (best_distance is None) or (distance < best_distance):
+                best, best_distance = joints, distance
+        return best
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 
 import rospy
+import threading
 
 import cv2
 import numpy as np
+from collections import OrderedDict, namedtuple
 import matplotlib.pyplot as plt
 from cv_bridge import CvBridge, CvBridgeError
 
@@ -16,13 +18,160 @@ HUE_RANGE = 20
 WHITE_THRESH = 15
 BLACK_THRESH = 25
 
+# HSV bounds (inclusive, as for cv2.inRange) of each color, worked out as the
+# per-color inRange masks always have. Note that red and orange sit at the
+# bottom of the hue range, so their lower bound wraps and they match nothing.
+def hue_bounds(bgr):
+    hue = cv2.cvtColor(np.uint8([[bgr]]), cv2.COLOR_BGR2HSV)[0][0][0]
+    return (np.array([hue - HUE_RANGE, 100, 100], dtype=np.uint8),
+            np.array([hue + HUE_RANGE, 255, 255], dtype=np.uint8))
+
+COLOR_BOUNDS = OrderedDict([
+    ('black', (np.array([0, 0, 0], dtype=np.uint8), np.array([179, 255, 0 + BLACK_THRESH], dtype=np.uint8))),
+    ('white', (np.array([0, 0, 255 - WHITE_THRESH], dtype=np.uint8), np.array([179, 0 + WHITE_THRESH, 255], dtype=np.uint8))),
+    ('blue', hue_bounds([255, 0, 0])),
+    ('green', hue_bounds([0, 255, 0])),
+    ('red', hue_bounds([0, 0, 255])),
+    ('orange', hue_bounds([0, 165, 255])),
+])
+COLOR_LABELS = list(COLOR_BOUNDS.keys())
+
+# Each color is a box in HSV, so the colors a pixel falls in are the AND of
+# per-channel tables: bit k of COLOR_CHANNEL_BITS[c][x] is set when value x of
+# channel c is within color k's bounds. Classifying a frame through them
+# matches the per-color inRange masks exactly; the colors do not overlap, so a
+# pixel has at most one bit set.
+def color_channel_bits():
+    values = np.arange(256, dtype=np.uint8)
+    bits = np.zeros((3, 256), dtype=np.uint8)
+    for k, (lower, upper) in enumerate(COLOR_BOUNDS.values()):
+        for c in range(3):
+            bits[c][(values >= lower[c]) & (values <= upper[c])] |= 1 << k
+    return bits
+
+COLOR_CHANNEL_BITS = color_channel_bits()
+COLOR_BIT = dict((color, 1 << k) for k, color in enumerate(COLOR_LABELS))
+
+# Per-pixel color bits of an HSV image, in one pass over each channel
+def classify_hsv(hsv_image):
+    h, s, v = cv2.split(hsv_image)
+    bits = cv2.LUT(h, COLOR_CHANNEL_BITS[0])
+    cv2.bitwise_and(bits, cv2.LUT(s, COLOR_CHANNEL_BITS[1]), dst=bits)
+    cv2.bitwise_and(bits, cv2.LUT(v, COLOR_CHANNEL_BITS[2]), dst=bits)
+    return bits
+
+# {color : pixel count} from classify_hsv's output. calcHist is a bincount over
+# the 256 bit patterns that skips the widening copy np.bincount makes
+def color_counts(bits):
+    counts = cv2.calcHist([bits], [0], None, [256], [0, 256]).ravel()
+    return dict((color, int(counts[bit])) for color, bit in COLOR_BIT.items())
+
+# Color each object is recognised by
+OBJECT_COLORS = OrderedDict([('cup', 'blue'), ('cover', 'green'), ('burner1', 'red')])
+VISIBLE_OBJECTS = list(OBJECT_COLORS.keys())
+
+WORKSPACE_HEIGHT = 0.3 # m above the table top that objects can reach
+ROI_MARGIN = 20 # px
+
+# Pixel box (x, y, w, h) covering the table top and WORKSPACE_HEIGHT above it,
+# or None if none of it is in front of the camera. table is the registry
+# entry; world_to_camera a 4x4 transform into the camera's optical frame;
+# camera_info the camera's CameraInfo. 
+def table_roi(table, world_to_camera, camera_info, margin=ROI_MARGIN):
+    cx, cy = table['pose'][0], table['pose'][1]
+    dx, dy = table['top_size'][0] / 2.0, table['top_size'][1] / 2.0
+    corners = np.array([[cx + sx * dx, cy + sy * dy, table['top_height'] + z, 1.0]
+                        for sx in (-1, 1) for sy in (-1, 1) for z in (0.0, WORKSPACE_HEIGHT)])
+    points = np.dot(world_to_camera, corners.T)
+    points = points[:, points[2] > 0]
+    if points.shape[1] == 0:
+        return None
+    pixels = np.dot(np.array(camera_info.P).reshape(3, 4), points)
+    u, v = pixels[0] / pixels[2], pixels[1] / pixels[2]
+    x0 = int(max(np.floor(u.min()) - margin, 0))
+    y0 = int(max(np.floor(v.min()) - margin, 0))
+    x1 = int(min(np.ceil(u.max()) + margin, camera_info.width))
+    y1 = int(min(np.ceil(v.max()) + margin, camera_info.height))
+    if (x1 <= x0) or (y1 <= y0):
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+# Homography from image pixels to (x, y) on the table top plane, in the same
+# world frame as table_roi
+def table_plane_homography(table, world_to_camera, camera_info):
+    plane = np.array([[1, 0, 0], [0, 1, 0], [0, 0, table['top_height']], [0, 0, 1]], dtype=float)
+    P = np.array(camera_info.P).reshape(3, 4)
+    return np.linalg.inv(np.dot(np.dot(P, world_to_camera), plane))
+
+# [(x, y)] on the table plane of [(u, v)] pixels
+def pixels_to_table(homography, pixels):
+    pixels = np.asarray(pixels, dtype=float).reshape(-1, 2)
+    points = np.dot(homography, np.vstack([pixels.T, np.ones(len(pixels))]))
+    return (points[:2] / points[2]).T
+
+# One connected area of a color, in full resolution pixels: area, centroid 
+# (u, v) and bounding box (x, y, w, h)
+Blob = namedtuple('Blob', ['color', 'area', 'centroid', 'bbox'])
+MIN_BLOB_AREA = 20 # px
+
+# Blobs of the given colors in classify_hsv's output. roi and downscale are 
+# those the frame was reduced with, to map the blobs back to full frames. 
+def color_blobs(bits, colors, roi=None, downscale=0, min_area=MIN_BLOB_AREA):
+    step = 2 ** downscale
+    x0, y0 = (roi[0], roi[1]) if roi is not None else (0, 0)
+    blobs = []
+    for color in colors:
+        mask = cv2.compare(bits, COLOR_BIT[color], cv2.CMP_EQ)
+        n, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        for i in range(1, n):
+            area = int(stats[i, cv2.CC_STAT_AREA]) * step * step
+            if area < min_area:
+                continue
+            blobs.append(Blob(color, area,
+                              (x0 + centroids[i][0] * step, y0 + centroids[i][1] * step),
+                              (x0 + int(stats[i, cv2.CC_STAT_LEFT]) * step, y0 + int(stats[i, cv2.CC_STAT_TOP]) * step,
+                               int(stats[i, cv2.CC_STAT_WIDTH]) * step, int(stats[i, cv2.CC_STAT_HEIGHT]) * step)))
+    return blobs
+
+# Crops a frame to roi (x, y, w, h; None for the whole frame) and halves it
+# 'downscale' times by keeping every other row and column. Unlike pyrDown this
+# does not blend object colors into the table around their edges, which would
+# push small objects out of their color ranges.
+def reduce_frame(frame, roi=None, downscale=0):
+    if roi is not None:
+        x, y, w, h = roi
+        frame = frame[y:y+h, x:x+w]
+    step = 2 ** downscale
+    return frame[::step, ::step]
+
+# The camera callback only keeps the latest frame (a one-slot buffer: a frame 
+# that arrives before the previous one was processed replaces it). Frames are 
+# classified lazily, by update(): on demand from is_visible and friends, and, 
+# if a rate is given, from a background thread at most that often. 
+# on_update(visible objects) is called from whichever thread processed a frame. 
+# With detect set, each processed frame also yields the blobs of the object 
+# colors (color_blobs), passed to on_detections(blobs). 
+#
+# Frames can be cropped to a region of interest and halved 'downscale' times 
+# before classification (reduce_frame); pixel counts are scaled back up to 
+# full resolution units, color_bits is left at the reduced size. 
 class ImageConverter:
-    def __init__(self):
+    def __init__(self, rate=None, on_update=None, roi=None, downscale=0, detect=False, on_detections=None):
         self.bridge = CvBridge()
         self.initTime = 0
         self.savedFrames = {}
         self.savedFramesStr = ""
-        self.image_sub = rospy.Subscriber("/cameras/head_camera/image", Image, self.callbackImage)
+        self._frame_lock = threading.Lock()
+        self._process_lock = threading.Lock()
+        self._latest_frame = None
+        self._processed_frame = None
+        self._on_update = on_update
+        self.roi = roi
+        self.downscale = downscale
+        self.detect = detect
+        self._on_detections = on_detections
+        self.blobs = []
+        self.image_sub = rospy.Subscriber("/cameras/head_camera/image", Image, self.callbackImage, queue_size = 1, buff_size = 2**24)
         # self.kinetic_sub = rospy.Subscriber("/kinect_camera/rgb/image_raw", Image, self.callbackKineticImage)
 
         # Color pixel count 
@@ -32,19 +181,53 @@ class ImageConverter:
         self.green_pixels = 0
         self.red_pixels = 0
         self.orange_pixels = 0
+        self.color_bits = None # per-pixel color bits of the last frame
 
-        self.color_ranges = {}
+        if rate is not None:
+            worker = threading.Thread(target=self.run, args=(rate,))
+            worker.daemon = True
+            worker.start()
 
     def callbackImage(self, data):
-        try:
-            cv_image = self.bridge.imgmsg_to_cv2(data, "bgr8")
-        except CvBridgeError as e:
-            print(e)
+        with self._frame_lock:
+            self._latest_frame = data
 
-        frame = cv_image
-        hsv_image = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    def run(self, rate):
+        r = rospy.Rate(rate)
+        while not rospy.is_shutdown():
+            self.update()
+            try:
+                r.sleep()
+            except rospy.ROSInterruptException:
+                return
 
-        self.color_count_pixels(hsv_image)
+    # Classifies the latest frame if it has not been yet. Returns whether it did.
+    def update(self):
+        with self._process_lock:
+            with self._frame_lock:
+                data = self._latest_frame
+            if (data is None) or (data is self._processed_frame):
+                return False
+            self._processed_frame = data
+            try:
+                cv_image = self.bridge.imgmsg_to_cv2(data, "bgr8")
+            except CvBridgeError as e:
+                print(e)
+                return False
+
+            frame = reduce_frame(cv_image, self.roi, self.downscale)
+            hsv_image = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+            self.color_count_pixels(hsv_image)
+            visible = self.visible_objects()
+            if self.detect:
+                self.blobs = color_blobs(self.color_bits, OBJECT_COLORS.values(), self.roi, self.downscale)
+            blobs = self.blobs
+        if self._on_update is not None:
+            self._on_update(visible)
+        if self.detect and (self._on_detections is not None):
+            self._on_detections(blobs)
+        return True
 
     # def callbackKineticImage(self, data):
     #     # print(type(data))
@@ -60,56 +243,23 @@ class ImageConverter:
 
 
     def color_count_pixels(self, hsv_image):
-        # Black pixels 
-        lower_black = np.array([0,0,0], dtype=np.uint8)
-        upper_black = np.array([179,255,0 + BLACK_THRESH], dtype=np.uint8)
-        black_mask = cv2.inRange(hsv_image, lower_black, upper_black)
-        self.black_pixels = np.count_nonzero(black_mask)
-        self.black_segments = self.count_segmented_areas(black_mask)
-
-        # White pixels 
-        lower_white = np.array([0,0,255 - WHITE_THRESH], dtype=np.uint8)
-        upper_white = np.array([179,0 + WHITE_THRESH,255], dtype=np.uint8)
-        white_mask = cv2.inRange(hsv_image, lower_white, upper_white)
-        self.white_pixels = np.count_nonzero(white_mask)
-        self.white_segments = self.count_segmented_areas(white_mask)
-
-        # Blue pixels 
-        blue = np.uint8([[[255, 0, 0]]]) # insert the bgr values which you want to convert to hsv
-        hsvBlue = cv2.cvtColor(blue, cv2.COLOR_BGR2HSV)
-        lower_blue = np.array([hsvBlue[0][0][0] - HUE_RANGE ,100,100], dtype=np.uint8)
-        upper_blue = np.array([hsvBlue[0][0][0] + HUE_RANGE,255,255], dtype=np.uint8)
-        blue_mask = cv2.inRange(hsv_image, lower_blue, upper_blue)
-        self.blue_pixels = np.count_nonzero(blue_mask)
-        self.blue_segments = self.count_segmented_areas(blue_mask)
-
-        # Green pixels 
-        green = np.uint8([[[0, 255, 0]]]) # insert the bgr values which you want to convert to hsv
-        hsvGreen = cv2.cvtColor(green, cv2.COLOR_BGR2HSV)
-        lower_green = np.array([hsvGreen[0][0][0] - HUE_RANGE,100,100], dtype=np.uint8)
-        upper_green = np.array([hsvGreen[0][0][0] + HUE_RANGE,255,255], dtype=np.uint8)
-        green_mask = cv2.inRange(hsv_image, lower_green, upper_green)
-        self.green_pixels = np.count_nonzero(green_mask)
-        # self.green_segments = self.count_segmented_areas(green_mask)
-
-        # Red pixels 
-        red = np.uint8([[[0, 0, 255]]]) # insert the bgr values which you want to convert to hsv
-        hsvRed = cv2.cvtColor(red, cv2.COLOR_BGR2HSV)
-        lower_red = np.array([hsvRed[0][0][0] - HUE_RANGE,100,100], dtype=np.uint8)
-        upper_red = np.array([hsvRed[0][0][0] + HUE_RANGE,255,255], dtype=np.uint8)
-        red_mask = cv2.inRange(hsv_image, lower_red, upper_red)
-        self.red_pixels = np.count_nonzero(red_mask)
-        self.red_segments = self.count_segmented_areas(red_mask)
-
-        # Orange pixels 
-        orange = np.uint8([[[0, 165, 255]]]) # insert the bgr values which you want to convert to hsv
-        hsvOrange = cv2.cvtColor(orange, cv2.COLOR_BGR2HSV)
-        lower_orange = np.array([hsvOrange[0][0][0] - HUE_RANGE,100,100], dtype=np.uint8)
-        upper_orange = np.array([hsvOrange[0][0][0] + HUE_RANGE,255,255], dtype=np.uint8)
-        orange_mask = cv2.inRange(hsv_image, lower_orange, upper_orange)
-        self.orange_pixels = np.count_nonzero(orange_mask)
-        self.orange_segments = self.count_segmented_areas(orange_mask)
+        self.color_bits = classify_hsv(hsv_image)
+        counts = color_counts(self.color_bits)
+        scale = 4 ** self.downscale
+        self.black_pixels = counts['black'] * scale
+        self.white_pixels = counts['white'] * scale
+        self.blue_pixels = counts['blue'] * scale
+        self.green_pixels = counts['green'] * scale
+        self.red_pixels = counts['red'] * scale
+        self.orange_pixels = counts['orange'] * scale
 
+    # Number of separate areas of the color in the last frame
+    def count_segments(self, color):
+        self.update()
+        if self.color_bits is None:
+            return 0
+        mask = cv2.compare(self.color_bits, COLOR_BIT[color], cv2.CMP_EQ)
+        return self.count_segmented_areas(mask)
 
     def count_segmented_areas(self, mask):
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
@@ -118,7 +268,14 @@ class ImageConverter:
         counts = counts[0] if len(counts) == 2 else counts[1]
         return len(counts)
 
+    def visible_objects(self):
+        return [obj for obj in VISIBLE_OBJECTS if self.color_visible(obj)]
+
     def is_visible(self, obj):
+        self.update()
+        return self.color_visible(obj)
+
+    def color_visible(self, obj):
         if (obj == 'cover'):
             return self.green_pixels > 0
         elif (obj == 'cup'):
@@ -131,6 +288,7 @@ class ImageConverter:
             return False
 
     def getObjectPixelCount(self, obj):
+        self.update()
         if (obj == 'cover'):
             return self.green_pixels
         elif (obj == 'cup'):
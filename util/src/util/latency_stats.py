@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import threading
+from bisect import bisect_right
+
+# Fixed-bin latency histograms, one per named hop of the state pipeline.
+# Bin k counts latencies in [edges[k-1], edges[k]) seconds; the last bin is
+# everything from the last edge up. Recording is thread safe.
+LATENCY_BIN_EDGES = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0]
+
+class LatencyHistogram(object):
+    def __init__(self, edges=LATENCY_BIN_EDGES):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency):
+        self.counts[bisect_right(self.edges, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+    # Upper edge of the bin holding the q-th quantile (inf for the overflow bin)
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for k, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.edges[k] if k < len(self.edges) else float('inf')
+        return float('inf')
+
+class LatencyStats(object):
+    def __init__(self, hops, edges=LATENCY_BIN_EDGES):
+        self.hops = list(hops)
+        self.edges = list(edges)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = dict((hop, LatencyHistogram(self.edges)) for hop in self.hops)
+
+    def record(self, hop, latency):
+        with self._lock:
+            self.histograms[hop].record(latency)
+
+    def get(self, hop):
+        return self.histograms[hop]
+
+    # [(hop, histogram)] in hop order; optionally starts a fresh set
+    def snapshot(self, reset=False):
+        with self._lock:
+            histograms = self.histograms
+            if reset:
+                self.histograms = dict((hop, LatencyHistogram(self.edges)) for hop in self.hops)
+        return [(hop, histograms[hop]) for hop in self.hops]
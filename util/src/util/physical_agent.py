@@ -5,6 +5,7 @@ import struct
 import sys
 import copy
 import numpy as np
+from collections import OrderedDict
 
 import rospy
 import rospkg
@@ -32,6 +33,7 @@ from std_msgs.msg import (
     Time, 
     Duration,
 )
+from sensor_msgs.msg import JointState
 
 from baxter_core_msgs.srv import (
     SolvePositionIK,
@@ -42,6 +44,21 @@ from tf.transformations import *
 
 import baxter_interface
 
+from util.ik_cache import IKCache
+from util.latency_stats import LatencyStats
+
+# IK service latency (wall time) by how the request was served: from the 
+# cache, solved from the nearest cached solution, or solved without a seed. 
+# Hits over all requests is the cache hit rate. 
+IK_HOPS = ['ik_hit', 'ik_seeded', 'ik_unseeded']
+# Largest joint change (rad) accepted between a waypoint and the solution it 
+# was seeded from; a switch to another redundancy branch of the 7-DOF arm 
+# shows up as a ~pi jump in an elbow or wrist joint. 
+MAX_JOINT_STEP = 2.0
+
+def joint_step(joints_a, joints_b):
+    return max([abs(joints_a[j] - joints_b[j]) for j in joints_a if j in joints_b] or [0.0])
+
 ##################################################################
 
 class PhysicalAgent(object):
@@ -62,6 +79,9 @@ class PhysicalAgent(object):
         self._joint_effort_svc = rospy.ServiceProxy('/gazebo/apply_joint_effort', ApplyJointEffort)
         self._body_wrench_svc = rospy.ServiceProxy('/gazebo/apply_body_wrench', ApplyBodyWrench)
 
+        self._ik_cache = IKCache()
+        self.ik_stats = LatencyStats(IK_HOPS)
+
         rospy.wait_for_service(ns_left, 5.0)
         rospy.wait_for_service(ns_right, 5.0)
 
@@ -105,13 +125,19 @@ class PhysicalAgent(object):
     def push(self, gripper, startPose, endPose, rate=10):
         gripper_name = gripper.replace('_gripper', '')
         limb = self.translateLimb(gripper_name)
+        waypoints = self._ik_waypoints(gripper_name, [self._hover_pose(startPose), startPose], 'push')
+        if waypoints is None:
+            return False
+        joint_angles_hover, joint_angles_start = waypoints
+        # end is solved from start, so that the velocity command between them 
+        # stays on one branch of the arm 
+        waypoints = self._ik_waypoints(gripper_name, [endPose], 'push', seed=joint_angles_start)
+        if waypoints is None:
+            return False
+        joint_angles_end = waypoints[0]
         self._gripper_close(gripper_name)
-        self._hover_approach(gripper_name, startPose)
-        self._approach(gripper_name, startPose)
-
-        ########### Add code here 
-        joint_angles_start = self.ik_request(gripper_name, startPose)
-        joint_angles_end = self.ik_request(gripper_name, endPose)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_hover)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_start)
 
         joint_movement_amounts = {}
         # T = 1.0/float(rate)
@@ -137,28 +163,15 @@ class PhysicalAgent(object):
         
         rospy.sleep(1)
         self._retract(gripper_name)
+        return True
 
     def grasp(self, gripper, objPose, orientation='left'):
-        # Note: For left gripper the initial object dimensions was 0.4 by 0.4 
-        # The right gripper does not open as far as the left gripper, so 0.25 by 0.25 is used 
-
         gripper_name = gripper.replace('_gripper', '')
-        self._gripper_open(gripper_name)
-
-        # Approach two different positions for smooth grasp action
-        orientationStr = gripper_name + '_' + orientation
-
-        # appr = copy.deepcopy(objPose)
-
-        for i in range(2):
-            pos = self._pos_offsets_dict[orientationStr + str(i)]
-            appr = copy.deepcopy(objPose)
-            appr.pose.position.x += pos[0]
-            appr.pose.position.y += pos[1]
-            appr.pose.position.z += pos[2]
-            self._approach(gripper_name, appr)
-
-        self._gripper_close(gripper_name)
+        waypoints = self._ik_waypoints(gripper_name, self._grasp_poses(gripper_name, objPose, orientation), 'grasp')
+        if waypoints is None:
+            return False
+        self._grasp(gripper_name, waypoints)
+        return True
 
     def shake(self, gripper, objPose, orientation='left', twist_range=1.0, rate=10.0):
         # For now, assume left gripper is moving (change to an argument)
@@ -176,8 +189,19 @@ class PhysicalAgent(object):
         limb_joints = limb.joint_names()
         joint_name= limb_joints[6] # gripper twist, left_w2
 
-        self.grasp(gripper_name, objPose, orientation)
-        self._hover_approach(gripper_name, objPose) # increases z position to lift object up
+        waypoints = self._ik_waypoints(gripper_name, self._grasp_poses(gripper_name, objPose, orientation) + 
+                                       [objPose], 'shake')
+        if waypoints is None:
+            return False
+        grasp_waypoints, joint_angles_obj = waypoints[:-1], waypoints[-1]
+        # the lift is solved from the object pose, so lowering back is a short move 
+        waypoints = self._ik_waypoints(gripper_name, [self._hover_pose(objPose)], 'shake', seed=joint_angles_obj)
+        if waypoints is None:
+            return False
+        joint_angles_hover = waypoints[0]
+
+        self._grasp(gripper_name, grasp_waypoints)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_hover) # increases z position to lift object up
 
         begin_position = limb.joint_angle(joint_name) # pose robot will move to at the end
 
@@ -194,39 +218,56 @@ class PhysicalAgent(object):
             
         joint_command = {joint_name: begin_position}
         limb.set_joint_positions(joint_command)
-        self._approach(gripper_name, objPose)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_obj)
         self._gripper_open(gripper_name)
-        self._hover_approach(gripper_name, objPose)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_hover)
+        return True
 
     def press(self, gripper, startPose, endPose, rate=100): 
         gripper_name = gripper.replace('_gripper', '')
+        waypoints = self._ik_waypoints(gripper_name, [startPose, endPose], 'press')
+        if waypoints is None:
+            return False
+        joint_angles_start, joint_angles_end = waypoints
         self._gripper_close(gripper_name)
-        self._approach(gripper_name, startPose)
-        self._approach(gripper_name, endPose, rate=rate)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_start)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_end, rate)
         self._retract(gripper_name)
+        return True
 
     def drop(self, gripper, objPose, dropPose):
         gripper_name = gripper.replace('_gripper', '')
+        waypoints = self._ik_waypoints(gripper_name, [self._hover_pose(objPose), objPose, dropPose], 'drop')
+        if waypoints is None:
+            return False
+        joint_angles_hover, joint_angles_obj, joint_angles_drop = waypoints
         self._gripper_open(gripper_name)
-        self._hover_approach(gripper_name, objPose)
-        self._approach(gripper_name, objPose)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_hover)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_obj)
         self._gripper_close(gripper_name)
-        self._approach(gripper_name, dropPose)
+        self._guarded_move_to_joint_position(gripper_name, joint_angles_drop)
         self._gripper_open(gripper_name)
+        return True
 
     def cover_obj(self, gripper, objPose1, objPose2):
         try:
             gripper_name = gripper.replace('_gripper', '')
+            placePose = copy.deepcopy(objPose2)
+            placePose.pose.position.z += 0.06
+            waypoints = self._ik_waypoints(gripper_name, [self._hover_pose(objPose1), objPose1, self._hover_pose(objPose2), 
+                                                          placePose, self._hover_pose(placePose)], 'cover_obj')
+            if waypoints is None:
+                return False
+            joint_angles_hover1, joint_angles_obj1, joint_angles_hover2, joint_angles_place, joint_angles_lift = waypoints
             self._gripper_open(gripper_name)
-            self._hover_approach(gripper_name, objPose1)
-            self._approach(gripper_name, objPose1)
+            self._guarded_move_to_joint_position(gripper_name, joint_angles_hover1)
+            self._guarded_move_to_joint_position(gripper_name, joint_angles_obj1)
             self._gripper_close(gripper_name)
-            self._hover_approach(gripper_name, objPose1)
-            self._hover_approach(gripper_name, objPose2)
-            objPose2.pose.position.z += 0.06
-            self._approach(gripper_name, objPose2)
+            self._guarded_move_to_joint_position(gripper_name, joint_angles_hover1)
+            self._guarded_move_to_joint_position(gripper_name, joint_angles_hover2)
+            self._guarded_move_to_joint_position(gripper_name, joint_angles_place)
             self._gripper_open(gripper_name)
-            self._hover_approach(gripper_name, objPose2)
+            self._guarded_move_to_joint_position(gripper_name, joint_angles_lift)
             self._retract(gripper_name)
             return True
         except:
@@ -334,10 +375,34 @@ class PhysicalAgent(object):
         self._guarded_move_to_joint_position(gripperName, joint_angles, rate)
 
     def _hover_approach(self, gripperName, pose):
+        joint_angles = self.ik_request(gripperName, self._hover_pose(pose))
+        self._guarded_move_to_joint_position(gripperName, joint_angles)
+
+    def _hover_pose(self, pose):
         appr = copy.deepcopy(pose)
         appr.pose.position.z = appr.pose.position.z + self._hover_distance
-        joint_angles = self.ik_request(gripperName, appr)
-        self._guarded_move_to_joint_position(gripperName, joint_angles)
+        return appr
+
+    # Approach two different positions for smooth grasp action
+    def _grasp_poses(self, gripperName, objPose, orientation):
+        # Note: For left gripper the initial object dimensions was 0.4 by 0.4 
+        # The right gripper does not open as far as the left gripper, so 0.25 by 0.25 is used 
+        orientationStr = gripperName + '_' + orientation
+        poses = []
+        for i in range(2):
+            pos = self._pos_offsets_dict[orientationStr + str(i)]
+            appr = copy.deepcopy(objPose)
+            appr.pose.position.x += pos[0]
+            appr.pose.position.y += pos[1]
+            appr.pose.position.z += pos[2]
+            poses.append(appr)
+        return poses
+
+    def _grasp(self, gripperName, joint_angles_list):
+        self._gripper_open(gripperName)
+        for joint_angles in joint_angles_list:
+            self._guarded_move_to_joint_position(gripperName, joint_angles)
+        self._gripper_close(gripperName)
 
 #####################################################################################################
 ######################### Internal Functions
@@ -368,34 +433,107 @@ class PhysicalAgent(object):
             return self._iksvc_right
 
     def ik_request(self, limbName, pose):
+        solutions, valid = self.ik_request_batch(limbName, [pose])
+        return solutions[0]
+
+    # Joint solutions for all the waypoints of a primitive in one IK round 
+    # trip: ([joint dict, or 0 if invalid], [valid]) in the order of poses. 
+    # Cached poses are not sent. The rest are warm started from the nearest 
+    # cached solution, or the current angles as seed_angles has to cover every 
+    # pose; SEED_AUTO still falls back to the nullspace setpoints. With a seed 
+    # (a joint dict) every pose is solved from it instead, and only solutions 
+    # within MAX_JOINT_STEP of it are valid, cached ones included. 
+    def ik_request_batch(self, limbName, poses, seed=None):
+        limb = 'left' if 'left' in limbName else 'right'
+        solutions = [0] * len(poses)
+        valid = [False] * len(poses)
+        pending = OrderedDict() # cache key -> indices of the poses
+        for i, pose in enumerate(poses):
+            start = time.time()
+            cached = self._ik_cache.get(limb, pose)
+            if (cached is not None) and (seed is not None) and (joint_step(cached, seed) > MAX_JOINT_STEP):
+                cached = None
+            if cached is not None:
+                solutions[i] = dict(cached)
+                valid[i] = True
+                self.ik_stats.record('ik_hit', time.time() - start)
+            else:
+                pending.setdefault(self._ik_cache.key(limb, pose), []).append(i)
+        if len(pending) == 0:
+            return solutions, valid
+
+        start = time.time()
         ikreq = SolvePositionIKRequest()
-        ikreq.pose_stamp.append(pose)
+        ikreq.seed_mode = ikreq.SEED_AUTO
+        seeded = []
+        current = None
+        for indices in pending.values():
+            pose = poses[indices[0]]
+            pose_seed = seed if seed is not None else self._ik_cache.nearest(limb, pose)
+            seeded.append(pose_seed is not None)
+            if pose_seed is None:
+                if current is None:
+                    current = self.translateLimb(limbName).joint_angles()
+                pose_seed = current
+            ikreq.pose_stamp.append(pose)
+            ikreq.seed_angles.append(JointState(name=pose_seed.keys(), position=pose_seed.values()))
         try:
             iksvc = self.translateIksvc(limbName)
             resp = iksvc(ikreq)
             # print(resp)
         except (rospy.ServiceException, rospy.ROSException), e:
             rospy.logerr("Service call failed: %s" % (e,))
-            return 0
+            return solutions, valid
+        finally:
+            # the round trip is shared by the poses it solved 
+            latency = (time.time() - start) / len(pending)
+            for s in seeded:
+                self.ik_stats.record('ik_seeded' if s else 'ik_unseeded', latency)
         resp_seeds = struct.unpack('<%dB' % len(resp.result_type), resp.result_type)
-        limb_joints = {}
-        if (resp_seeds[0] != resp.RESULT_INVALID):
+        for k, indices in enumerate(pending.values()):
+            if (resp_seeds[k] == resp.RESULT_INVALID):
+                rospy.logerr("INVALID POSE - No Valid Joint Solution Found for waypoint {0}.".format(indices[0]))
+                continue
             seed_str = {
                         ikreq.SEED_USER: 'User Provided Seed',
                         ikreq.SEED_CURRENT: 'Current Joint Angles',
                         ikreq.SEED_NS_MAP: 'Nullspace Setpoints',
-                       }.get(resp_seeds[0], 'None')
+                       }.get(resp_seeds[k], 'None')
             if self._verbose:
                 print("IK Solution SUCCESS - Valid Joint Solution Found from Seed Type: {0}".format(
                          (seed_str)))
-            limb_joints = dict(zip(resp.joints[0].name, resp.joints[0].position))
+            limb_joints = dict(zip(resp.joints[k].name, resp.joints[k].position))
+            if (seed is not None) and (joint_step(limb_joints, seed) > MAX_JOINT_STEP):
+                rospy.logerr("IK solution for waypoint {0} is {1:.2f} rad from its seed, rejected.".format(
+                             indices[0], joint_step(limb_joints, seed)))
+                continue
+            self._ik_cache.put(limb, poses[indices[0]], limb_joints)
+            for i in indices:
+                solutions[i] = dict(limb_joints)
+                valid[i] = True
             if self._verbose:
                 print("IK Joint Solution:\n{0}".format(limb_joints))
                 print("------------------")
-        else:
-            rospy.logerr("INVALID POSE - No Valid Joint Solution Found.")
-            return 0
-        return limb_joints
+        return solutions, valid
+
+    # Solves the waypoints of a primitive up front, so that it does not start 
+    # moving towards a trajectory it cannot finish. None if any is invalid. 
+    def _ik_waypoints(self, gripperName, poses, primitive, seed=None):
+        solutions, valid = self.ik_request_batch(gripperName, poses, seed)
+        if not all(valid):
+            rospy.logerr("{0}: no IK solution for waypoints {1}, not executing.".format(
+                         primitive, [i for i, v in enumerate(valid) if not v]))
+            return None
+        return solutions
+
+    # IK latency histograms since the last reset, with the cache hit rate 
+    def ik_stats_snapshot(self, reset=False):
+        hops = self.ik_stats.snapshot(reset)
+        requests = sum(h.count for _, h in hops)
+        hits = dict(hops)['ik_hit'].count
+        rospy.loginfo("IK cache: {0}/{1} hits ({2:.1f}%), {3} cached solutions".format(
+                      hits, requests, 100.0 * hits / requests if requests > 0 else 0.0, len(self._ik_cache)))
+        return hops
 
 
 ####################################################################################################
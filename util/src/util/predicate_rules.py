@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import heapq
+import numpy as np
+
+# Derived predicates as declarative rules over boolean facts. A fact is a tuple
+# key, e.g. ('touching', 'cup', 'table'). Input facts (geometric relations,
+# flags) are set by the caller; every other fact is the output of one rule.
+#
+# The rules are compiled once into a topological order plus a map from each fact
+# to the rules reading it, so an update only re-evaluates rules downstream of
+# inputs that actually changed. Sticky rules (latches) stay true until reset().
+
+class Rule(object):
+    def __init__(self, fact, inputs, test, sticky=False, publish=True):
+        self.fact = tuple(fact)
+        self.inputs = [tuple(i) for i in inputs]
+        self.test = test
+        self.sticky = sticky
+        self.publish = publish
+
+def all_of(fact, *inputs):
+    return Rule(fact, inputs, lambda *values: all(values))
+
+def any_of(fact, *inputs):
+    return Rule(fact, inputs, lambda *values: any(values))
+
+# Becomes true when any input is true and stays true until reset. Not published.
+def latch(fact, *inputs):
+    return Rule(fact, inputs, lambda *values: any(values), sticky=True, publish=False)
+
+# Orders rules so that each comes after the rules producing its inputs, keeping
+# declaration order otherwise
+def order_rules(rules):
+    producers = {}
+    for rule in rules:
+        if rule.fact in producers:
+            raise ValueError("Fact produced by more than one rule: " + str(rule.fact))
+        producers[rule.fact] = rule
+
+    ordered = []
+    state = {} # fact -> 'visiting' | 'done'
+    def visit(rule):
+        mark = state.get(rule.fact)
+        if mark == 'done':
+            return
+        if mark == 'visiting':
+            raise ValueError("Cyclic predicate rules at: " + str(rule.fact))
+        state[rule.fact] = 'visiting'
+        for i in rule.inputs:
+            if i in producers:
+                visit(producers[i])
+        state[rule.fact] = 'done'
+        ordered.append(rule)
+
+    for rule in rules:
+        visit(rule)
+    return ordered
+
+class RuleEngine(object):
+    def __init__(self, rules):
+        self.rules = order_rules(rules)
+        self.values = {}
+        self.dependents = {}
+        for k, rule in enumerate(self.rules):
+            self.values[rule.fact] = False
+            for i in rule.inputs:
+                self.values.setdefault(i, False)
+                self.dependents.setdefault(i, []).append(k)
+        self.masks = {}
+        self.pending = []
+        self.scheduled = set()
+        # Evaluate everything once so non-trivial defaults (e.g. negations) settle
+        for k in range(len(self.rules)):
+            self._schedule(k)
+
+    def _schedule(self, k):
+        if k not in self.scheduled:
+            self.scheduled.add(k)
+            heapq.heappush(self.pending, k)
+
+    def _set(self, fact, value):
+        value = bool(value)
+        if self.values.get(fact, False) != value:
+            self.values[fact] = value
+            for k in self.dependents.get(fact, ()):
+                self._schedule(k)
+
+    def set_input(self, fact, value):
+        self._set(tuple(fact), value)
+
+    # Sets facts[k] from a boolean array, touching only the entries that differ
+    # from the last mask given under the same name
+    def set_mask(self, name, facts, mask):
+        last = self.masks.get(name)
+        mask = np.asarray(mask, dtype=bool)
+        if last is None:
+            changed = range(len(mask))
+        else:
+            changed = np.flatnonzero(mask != last)
+        for k in changed:
+            self._set(facts[k], mask[k])
+        self.masks[name] = mask.copy()
+
+    # Re-evaluates the rules whose inputs changed, in dependency order. Returns
+    # the derived facts whose value changed.
+    def update(self):
+        changed = []
+        while self.pending:
+            k = heapq.heappop(self.pending)
+            self.scheduled.discard(k)
+            rule = self.rules[k]
+            old = self.values[rule.fact]
+            new = bool(rule.test(*[self.values[i] for i in rule.inputs]))
+            if rule.sticky:
+                new = new or old
+            if new != old:
+                self._set(rule.fact, new)
+                changed.append(rule.fact)
+        return changed
+
+    # Releases the sticky facts
+    def reset(self):
+        for k, rule in enumerate(self.rules):
+            if rule.sticky:
+                self._set(rule.fact, False)
+                self._schedule(k)
+
+    def holds(self, fact):
+        return self.values.get(tuple(fact), False)
+
+    # Published facts that currently hold, in rule order
+    def true_facts(self):
+        return [rule.fact for rule in self.rules if rule.publish and self.values[rule.fact]]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+import threading
+
+import rospy
+
+from environment.msg import PredicateDelta
+from environment.srv import ScenarioDataDiffSrv
+from util.data_conversion import applyStateDiff
+from util.state_timeline import StateTimeline
+
+# Keeps a local copy of the scenario's init state from the predicate_deltas 
+# topic. Every delta carries its sequence number and the one it follows; if a 
+# delta is missed, the state is resynced through scenario_data_diff_srv (which 
+# returns the full state when the last seen version is too old). Received 
+# states are also kept on a local timeline keyed by the sim time of the world 
+# tick they were computed from. The stream syncs once when built, so the 
+# timeline covers everything from then on. 
+SETTLE_POLL = 0.1     # s, scenario_data's update period
+SETTLE_TIMEOUT = 2.0  # s
+
+class PredicateStream(object):
+    def __init__(self, callback=None, timeline_length=1000):
+        self.seq = None
+        self.state = set()
+        self.source_stamp = rospy.Time()
+        self.timeline = StateTimeline(timeline_length)
+        self._callback = callback
+        self._cond = threading.Condition()
+        self._diff_srv = rospy.ServiceProxy('scenario_data_diff_srv', ScenarioDataDiffSrv)
+        self._sub = rospy.Subscriber('predicate_deltas', PredicateDelta, self.callbackDelta)
+        rospy.wait_for_service('scenario_data_diff_srv')
+        self.sync()
+
+    def callbackDelta(self, msg):
+        with self._cond:
+            if (self.seq is not None) and (msg.seq <= self.seq):
+                return
+            if (self.seq is not None) and (msg.prev_seq == self.seq):
+                self.state = self.state.difference(msg.removed).union(msg.added)
+                self.seq = msg.seq
+                self.timeline.append(msg.header.stamp, self.seq, self.state)
+                added, removed = list(msg.added), list(msg.removed)
+            else:
+                added, removed = self._resync()
+            self._cond.notify_all()
+        if (self._callback is not None) and (added or removed):
+            self._callback(self.seq, added, removed)
+
+    def _resync(self):
+        since = -1 if self.seq is None else self.seq
+        try:
+            diff = self._diff_srv(since)
+        except rospy.ServiceException as e:
+            rospy.logerr("Predicate stream resync failed: {0}".format(e))
+            return [], []
+        self.state, added, removed = applyStateDiff(self.state, diff)
+        changed = (diff.version != self.seq) or (len(self.timeline) == 0)
+        self.seq = diff.version
+        self.source_stamp = diff.source_stamp
+        if changed:
+            last = self.timeline.last_stamp()
+            self.timeline.append(diff.source_stamp if last is None else max(diff.source_stamp, last), self.seq, self.state)
+        return added, removed
+
+    def sync(self):
+        with self._cond:
+            self._resync()
+            return self.seq, list(self.state)
+
+    def current(self):
+        with self._cond:
+            if self.seq is None:
+                self._resync()
+            return self.seq, list(self.state)
+
+    # State that accounts for every world tick up to stamp, e.g. the end of an 
+    # action: asks scenario_data until its state was computed from poses 
+    # received at or after stamp, so neither its last rate-limited update nor a 
+    # delta still in transit is missed. Gives the latest state after timeout. 
+    def settled(self, stamp, timeout=SETTLE_TIMEOUT):
+        deadline = rospy.get_time() + timeout
+        with self._cond:
+            self._resync()
+            while (self.source_stamp < stamp) and (rospy.get_time() < deadline):
+                self._cond.wait(SETTLE_POLL)
+                self._resync()
+            if self.source_stamp < stamp:
+                rospy.logwarn("Predicate state still behind the requested stamp after {0}s".format(timeout))
+            return self.seq, list(self.state)
+
+    # State as of the given stamp, or (None, None) if the stamp is older than 
+    # anything kept. Only final once the stream has settled past the stamp. 
+    def at(self, stamp):
+        with self._cond:
+            entry = self.timeline.at(stamp)
+            if entry is None:
+                return None, None
+            return entry[1], list(entry[2])
+
+    # Blocks until the atom holds (or, for '(not ...)', no longer holds)
+    def wait_for(self, atom, timeout=None):
+        negated = atom.startswith('(not ')
+        atom = atom[5:-1] if negated else atom
+        deadline = None if timeout is None else (rospy.get_time() + timeout)
+        with self._cond:
+            while (atom in self.state) == negated:
+                remaining = None if deadline is None else (deadline - rospy.get_time())
+                if (remaining is not None) and (remaining <= 0.0):
+                    return False
+                self._cond.wait(remaining)
+            return True
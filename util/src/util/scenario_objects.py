@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+from collections import namedtuple, OrderedDict
+
+from util.scenario_registry import environment_models
+from util.predicate_rules import all_of, latch, Rule
+
+# Every object the environment can contain; which of them each environment
+# spawns is in the scenario registry. load_environment announces the active scenario on ACTIVE_SCENARIO_TOPIC
+# (latched), and publish_environment / scenario_data only track its objects.
+# Their poses travel together, one environment/WorldState per tick, on
+# WORLD_STATE_TOPIC.
+#
+#   model      gazebo model name, or None for objects built from links
+#   links      gazebo links whose positions are averaged (the grippers)
+#   from_point publish_environment drops the pose onto the table frame (poseFromPoint)
+#   z_offset   applied by scenario_data on receipt
+SceneObject = namedtuple('SceneObject', ['name', 'model', 'links', 'from_point', 'z_offset'])
+
+ACTIVE_SCENARIO_TOPIC = 'active_scenario'
+WORLD_STATE_TOPIC = 'world_state'
+
+OBJECTS = OrderedDict((o.name, o) for o in [
+    SceneObject('left_gripper', None, ['l_gripper_l_finger', 'l_gripper_r_finger'], False, -1.0),
+    SceneObject('right_gripper', None, ['r_gripper_l_finger', 'r_gripper_r_finger'], False, -1.0),
+    SceneObject('table', 'cafe_table', [], False, -0.2),
+    SceneObject('cup', 'cup', [], True, 0.0),
+    SceneObject('cover', 'cover', [], True, 0.0),
+    SceneObject('burner1', 'burner1', [], True, 0.0),
+    SceneObject('left_button', 'left_button', [], True, 0.0),
+    SceneObject('right_button', 'right_button', [], True, 0.0),
+    # SceneObject('breakable_obj', 'breakable_obj', [], True, 0.0),
+])
+
+# Present in every scenario
+ALWAYS_PRESENT = ['left_gripper', 'right_gripper', 'table']
+
+# Contact relations scenario_data evaluates (util.spatial_relations.ContactTable):
+# (obj1, obj2, xy_epsilon, z_epsilon) and 
+# (obj, actuator, xy_epsilon, z_epsilon, press_z_dist), in publishing order. 
+TOUCHING_PAIRS = [('left_gripper', 'table', 1.0, 0.1),
+                  ('right_gripper', 'table', 1.0, 0.1),
+                  ('cup', 'table', 1.0, 0.1),
+                  ('cover', 'table', 1.0, 0.1),
+                  ('cover', 'cup', 0.1, None),
+                  ('left_gripper', 'cover', 0.1, None),
+                  ('right_gripper', 'cover', 0.1, None),
+                  ('cover', 'burner1', 0.1, 0.06),
+                  ('cup', 'burner1', 0.1, 0.06)]
+PRESSING_PAIRS = [('left_gripper', 'left_button', 0.07, None, 0.08),
+                  ('right_gripper', 'left_button', 0.07, None, 0.08),
+                  ('left_gripper', 'right_button', 0.07, None, 0.08),
+                  ('right_gripper', 'right_button', 0.07, None, 0.08),
+                  ('cup', 'cover', 0.07, None, 0.1),
+                  ('cover', 'cup', 0.07, None, 0.1)]
+COVER_PAIRS = [('cup', 'cover'), ('cover', 'cup')]
+
+# Physical predicates derived from the contact relations above 
+# (util.predicate_rules), over the input facts ('contact', obj1, obj2), 
+# ('press', obj, actuator) and ('require_burner_on',). Declared in the order 
+# they have always been published (each on_burner right after its touching). 
+# The button latches stay set until reset_env_preds. Note the burner is 
+# switched on by the right button, which also marks the left button pressed. 
+# test/scripts/benchmark_predicate_rules.py checks them against the original 
+# if-chains. 
+def physical_state_rules(touching_pairs=None):
+    if touching_pairs is None:
+        touching_pairs = [(t[0], t[1]) for t in TOUCHING_PAIRS]
+    rules = []
+    on_burner_items = []
+    for pair in touching_pairs:
+        rules.append(all_of(('touching',) + pair, ('contact',) + pair))
+        if pair[1] == 'burner1':
+            rules.append(all_of(('on_burner',) + pair, ('contact',) + pair))
+            on_burner_items.append(pair[0])
+    rules.append(latch(('left_button_latched',), ('press', 'left_gripper', 'left_button'), ('press', 'right_gripper', 'left_button')))
+    rules.append(latch(('right_button_latched',), ('press', 'left_gripper', 'right_button'), ('press', 'right_gripper', 'right_button')))
+
+    for obj, actuator in COVER_PAIRS:
+        rules.append(all_of(('covered', actuator), ('press', obj, actuator)))
+
+    rules.append(all_of(('pressed', 'left_button'), ('right_button_latched',)))
+    rules.append(all_of(('powered_on', 'burner1'), ('right_button_latched',)))
+    rules.append(all_of(('pressed', 'right_button'), ('right_button_latched',)))
+
+    for item in on_burner_items:
+        rules.append(Rule(('cooking', item), 
+                          [('on_burner', item, 'burner1'), ('covered', item), ('require_burner_on',), ('powered_on', 'burner1')],
+                          lambda on_burner, covered, required, powered: on_burner and covered and (powered or not required)))
+    return rules
+
+# Models spawned per environment setting come from the scenario registry
+def active_objects(environment):
+    models = environment_models(environment)
+    return [name for name in OBJECTS if name in ALWAYS_PRESENT or name in models]
+
+# Dense table of object poses, indexed in OBJECTS order so the indices line up
+# with a ContactTable built over the same names. Only active objects report a pose.
+class ObjectRegistry(object):
+    def __init__(self, names=None):
+        self.names = list(OBJECTS if names is None else names)
+        self.index = dict((n, i) for i, n in enumerate(self.names))
+        self.poses = [None] * len(self.names)
+        self.active = [False] * len(self.names)
+
+    # Returns the (added, removed) object names
+    def activate(self, names):
+        wanted = set(names)
+        added = []
+        removed = []
+        for i, name in enumerate(self.names):
+            if (name in wanted) and not self.active[i]:
+                self.active[i] = True
+                added.append(name)
+            elif (name not in wanted) and self.active[i]:
+                self.active[i] = False
+                self.poses[i] = None
+                removed.append(name)
+        return added, removed
+
+    def is_active(self, name):
+        i = self.index.get(name)
+        return (i is not None) and self.active[i]
+
+    def active_names(self):
+        return [n for i, n in enumerate(self.names) if self.active[i]]
+
+    # Returns the previous pose
+    def set_pose(self, name, pose):
+        i = self.index[name]
+        previous = self.poses[i]
+        self.poses[i] = pose
+        return previous
+
+    def get_pose(self, name):
+        i = self.index.get(name)
+        return None if i is None else self.poses[i]
+
+    # (name, pose) of active objects with a pose
+    def items(self):
+        return [(n, self.poses[i]) for i, n in enumerate(self.names) if self.active[i] and self.poses[i] is not None]
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+import os
+import yaml
+import rospkg
+
+# Access to environment/config/scenarios.yaml. The file is parsed on first use
+# and kept for the life of the process.
+SCENARIO_REGISTRY_FILE = 'config/scenarios.yaml'
+
+_registry = None
+
+def scenario_registry():
+    global _registry
+    if _registry is None:
+        path = os.path.join(rospkg.RosPack().get_path('environment'), SCENARIO_REGISTRY_FILE)
+        with open(path, 'r') as registry_file:
+            _registry = yaml.safe_load(registry_file)
+    return _registry
+
+def environment_spec(environment):
+    environments = scenario_registry()['environments']
+    return environments.get(environment, environments['default'])
+
+# Names of the models spawned for an environment setting, table excluded
+def environment_models(environment):
+    return [model['name'] for model in environment_spec(environment)['spawn']]
+
+# Experiment settings for a scenario, or None if it is not registered
+def scenario_spec(scenario):
+    return scenario_registry()['scenarios'].get(scenario)
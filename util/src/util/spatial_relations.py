@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+
+# Vectorized versions of data_conversion.is_touching / is_pressed. Object
+# positions are held in one N x 3 array (NaN rows for objects with no pose yet)
+# and the xy and z distances between every pair come out of one broadcast.
+# Which pairs matter, and with which epsilons, is given by a per-pair table.
+#
+# For large scenes a uniform grid over the xy plane can be attached. It is
+# updated incrementally as poses arrive, and only the tabled pairs whose cells
+# are within their epsilon are measured, instead of every pair of objects.
+
+def pairwise_distances(positions):
+    diff = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+    xy = np.hypot(diff[..., 0], diff[..., 1])
+    dz = diff[..., 2]
+    return xy, dz
+
+class UniformGrid(object):
+    def __init__(self, cell_size, size=0):
+        self.cell_size = float(cell_size)
+        self.cell_array = np.zeros((size, 2), dtype=np.int64)
+        self.present = np.zeros(size, dtype=bool)
+
+    def cell_of(self, x, y):
+        return (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+
+    def update(self, key, x, y):
+        self.cell_array[key] = self.cell_of(x, y)
+        self.present[key] = True
+
+    def remove(self, key):
+        self.present[key] = False
+
+    # Per pair (i[k], j[k]): are the two cells close enough to be within radius[k]
+    def candidates(self, i, j, radius):
+        reach = np.ceil(radius / self.cell_size)
+        apart = np.abs(self.cell_array[i] - self.cell_array[j]).max(axis=1)
+        return self.present[i] & self.present[j] & (apart <= reach)
+
+class ContactTable(object):
+    # touching: [(obj1, obj2, xy_epsilon, z_epsilon)]
+    # pressing: [(obj, actuator, xy_epsilon, z_epsilon, press_z_dist)]
+    # epsilons follow is_touching/is_pressed: z_epsilon None -> xy_epsilon,
+    # press_z_dist None -> 0.8*xy_epsilon
+    def __init__(self, names, touching, pressing, cell_size=None):
+        self.names = list(names)
+        self.index = dict((n, i) for i, n in enumerate(self.names))
+        self.touching_pairs = [(t[0], t[1]) for t in touching]
+        self.pressing_pairs = [(p[0], p[1]) for p in pressing]
+
+        self._t_i = np.array([self.index[t[0]] for t in touching], dtype=np.intp)
+        self._t_j = np.array([self.index[t[1]] for t in touching], dtype=np.intp)
+        self._t_xy = np.array([t[2] for t in touching], dtype=float)
+        self._t_z = np.array([t[2] if t[3] is None else t[3] for t in touching], dtype=float)
+
+        self._p_i = np.array([self.index[p[0]] for p in pressing], dtype=np.intp)
+        self._p_j = np.array([self.index[p[1]] for p in pressing], dtype=np.intp)
+        self._p_xy = np.array([p[2] for p in pressing], dtype=float)
+        self._p_z = np.array([p[2] if p[3] is None else p[3] for p in pressing], dtype=float)
+        self._p_press = np.array([0.8*p[2] if p[4] is None else p[4] for p in pressing], dtype=float)
+
+        self.positions = self.empty_positions()
+        self.grid = None if cell_size is None else UniformGrid(cell_size, len(self.names))
+
+    def empty_positions(self):
+        return np.full((len(self.names), 3), np.nan)
+
+    def set_position(self, name, position):
+        i = self.index[name]
+        self.positions[i] = position
+        if self.grid is not None:
+            self.grid.update(i, position[0], position[1])
+
+    def remove_position(self, name):
+        i = self.index[name]
+        self.positions[i] = np.nan
+        if self.grid is not None:
+            self.grid.remove(i)
+
+    # Returns boolean masks over the touching and pressing tables
+    def evaluate(self, positions=None):
+        if positions is None:
+            positions = self.positions
+        with np.errstate(invalid='ignore'):
+            if self.grid is None:
+                xy, dz = pairwise_distances(positions)
+                t_xy, t_dz = xy[self._t_i, self._t_j], dz[self._t_i, self._t_j]
+                p_xy, p_dz = xy[self._p_i, self._p_j], dz[self._p_i, self._p_j]
+            else:
+                t_xy, t_dz = self._near_pair_distances(positions, self._t_i, self._t_j, self._t_xy)
+                p_xy, p_dz = self._near_pair_distances(positions, self._p_i, self._p_j, self._p_xy)
+
+            touching = (t_xy < self._t_xy) & (np.abs(t_dz) < self._t_z)
+            pressed = ((p_xy < self._p_xy) & (np.abs(p_dz) < self._p_z) &
+                       (0.0 < p_dz) & (p_dz < self._p_press))
+        return touching, pressed
+
+    # Distances for the table pairs the grid says could be in range, NaN for the rest
+    def _near_pair_distances(self, positions, i, j, xy_epsilon):
+        xy = np.full(len(i), np.nan)
+        dz = np.full(len(i), np.nan)
+        k = np.flatnonzero(self.grid.candidates(i, j, xy_epsilon))
+        diff = positions[i[k]] - positions[j[k]]
+        xy[k] = np.hypot(diff[:, 0], diff[:, 1])
+        dz[k] = diff[:, 2]
+        return xy, dz
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+from bisect import bisect_right
+
+# Bounded ring buffer of timestamped state versions. Each entry is the state
+# that held from its stamp until the next entry's stamp. Stamps are whatever
+# the caller uses consistently (rospy.Time or float seconds); they are expected
+# to be appended in non-decreasing order.
+#
+# The buffer is copy-on-write: append builds new tuples and swaps them in as a
+# single reference, so readers on other threads always see a consistent
+# timeline without taking a lock. Appends must come from one writer at a time.
+class StateTimeline(object):
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self._data = ((), ()) # (stamps, (version, frozenset of atoms) entries)
+
+    def append(self, stamp, version, state):
+        stamps, entries = self._data
+        self._data = ((stamps + (stamp,))[-self.maxlen:],
+                      (entries + ((version, frozenset(state)),))[-self.maxlen:])
+
+    def __len__(self):
+        return len(self._data[0])
+
+    # Stamp of the newest entry, or None if empty
+    def last_stamp(self):
+        stamps = self._data[0]
+        return stamps[-1] if stamps else None
+
+    # (stamp, version, state) in effect at t, or None if t is before the oldest
+    # retained entry
+    def at(self, t):
+        stamps, entries = self._data
+        i = bisect_right(stamps, t) - 1
+        if i < 0:
+            return None
+        version, state = entries[i]
+        return stamps[i], version, state
+
+    # Entries in effect at any point in [t0, t1], oldest first
+    def between(self, t0, t1):
+        stamps, entries = self._data
+        start = max(bisect_right(stamps, t0) - 1, 0)
+        end = bisect_right(stamps, t1) - 1
+        return [(stamps[i],) + entries[i] for i in range(start, end + 1)]
+
+    # Stamp of the first entry from 'since' onward in which the atom holds. If it
+    # already held at 'since', that is the stamp of the entry in effect then.
+    def first_true(self, atom, since=None):
+        stamps, entries = self._data
+        start = 0 if since is None else max(bisect_right(stamps, since) - 1, 0)
+        for i in range(start, len(stamps)):
+            if atom in entries[i][1]:
+                return stamps[i]
+        return None
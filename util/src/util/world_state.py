@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+# Bitset representation of world states over grounded pddl atoms. Every atom
+# string (e.g. '(covered cup)') is interned to an integer id, and a state is an
+# int with bit i set iff atom i holds. Python ints are arbitrary-precision, so
+# union/intersection/containment run word-at-a-time (atoms/64) in C.
+#
+# Goals, preconditions and effects compile to a (positive, negative) mask pair.
+
+class AtomTable(object):
+    def __init__(self):
+        self.ids = {}
+        self.atoms = []
+        self.loc_mask = 0
+
+    def intern(self, atom):
+        i = self.ids.get(atom)
+        if i is None:
+            i = len(self.atoms)
+            self.ids[atom] = i
+            self.atoms.append(atom)
+            if atom_operator(atom) == 'at':
+                self.loc_mask |= (1 << i)
+        return i
+
+    def mask(self, atoms):
+        m = 0
+        for atom in atoms:
+            m |= (1 << self.intern(atom))
+        return m
+
+    def to_atoms(self, mask):
+        atoms = []
+        while mask:
+            low = mask & -mask
+            atoms.append(self.atoms[low.bit_length() - 1])
+            mask ^= low
+        return atoms
+
+    def __len__(self):
+        return len(self.atoms)
+
+# Shared by everything in the process, so masks built in different places are comparable
+ATOMS = AtomTable()
+
+# s-expression parser: '(not (at cover 0.5,0.0,0.0))' -> ('not', ('at', 'cover', '0.5,0.0,0.0'))
+def parse_atom(atom):
+    stack = [[]]
+    for token in atom.replace('(', ' ( ').replace(')', ' ) ').split():
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) < 2:
+                raise ValueError("Malformed pddl atom: " + atom)
+            closed = tuple(stack.pop())
+            stack[-1].append(closed)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise ValueError("Malformed pddl atom: " + atom)
+    return stack[0][0]
+
+def format_atom(parsed):
+    if type(parsed) is not tuple:
+        return parsed
+    return '(' + ' '.join(format_atom(x) for x in parsed) + ')'
+
+# (negated, operator, args) of a parsed atom
+def split_atom(parsed):
+    negated = (parsed[0] == 'not')
+    inner = parsed[1] if negated else parsed
+    return negated, inner[0], list(inner[1:])
+
+def is_negated(atom):
+    return atom.startswith('(not ')
+
+def strip_negation(atom):
+    return atom[5:-1] if is_negated(atom) else atom
+
+def negate(atoms):
+    return ['(not ' + x + ')' for x in atoms]
+
+def atom_operator(atom):
+    parts = strip_negation(atom)[1:].split()
+    return parts[0].rstrip(')') if len(parts) > 0 else ''
+
+def compile_conditions(conditions, table=ATOMS):
+    pos = 0
+    neg = 0
+    for c in conditions:
+        if is_negated(c):
+            neg |= (1 << table.intern(strip_negation(c)))
+        else:
+            pos |= (1 << table.intern(c))
+    return pos, neg
+
+def holds(state, compiled):
+    pos, neg = compiled
+    return ((state & pos) == pos) and ((state & neg) == 0)
+
+def state_diff(pre, post):
+    return (post & ~pre), (pre & ~post)
+
+# Atoms that became true, and negations of those that stopped being true
+def describe_changes(added, removed, table=ATOMS, include_loc=True):
+    if include_loc == False:
+        added &= ~table.loc_mask
+        removed &= ~table.loc_mask
+    return table.to_atoms(added) + negate(table.to_atoms(removed))
+
+# Expected effects are met when every positive one holds after the step and
+# every negated one held before it and was removed by it.
+def effects_met(pre, added, removed, expected, table=ATOMS, include_loc=True):
+    pos, neg = compile_conditions(expected, table)
+    if include_loc == False:
+        pos &= ~table.loc_mask
+        neg &= ~table.loc_mask
+    post = (pre & ~removed) | added
+    return ((post & pos) == pos) and ((removed & neg) == neg)